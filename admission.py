@@ -0,0 +1,60 @@
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class AdmissionRejected(Exception):
+    """Raised when every slot is busy and the wait queue is full."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """
+    Concurrency limit with a bounded wait queue.
+
+    At most `max_concurrency` holders run at once and at most `max_queue`
+    callers wait for a slot; anyone beyond that is rejected immediately with a
+    Retry-After estimate, instead of piling up work the box cannot absorb.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        # Moving average of how long a slot is held, for Retry-After
+        self.avg_hold = 1.0
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def retry_after(self) -> int:
+        rounds = (self.waiting + self.active) / self.max_concurrency
+        return max(1, math.ceil(self.avg_hold * rounds))
+
+    @asynccontextmanager
+    async def slot(self):
+        """Yields the seconds spent queueing once a slot is held."""
+        if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(
+                f"{self.name} is saturated ({self.active} running, {self.waiting} queued)", self.retry_after()
+            )
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        acquired_at = time.perf_counter()
+        self.active += 1
+        try:
+            yield acquired_at - queued_at
+        finally:
+            self.active -= 1
+            self._slots.release()
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * (time.perf_counter() - acquired_at)
@@ -0,0 +1,149 @@
+import time
+import random
+import asyncio
+import logging
+import httpx
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger("AIClient")
+
+# Calls to the AI boxes are non-idempotent POSTs, so they are only resent when the
+# backend cannot have started the work: the proxy had no upstream (502), the box is
+# overloaded or restarting (503), or no connection was ever made. A read timeout or
+# a 504 means the first copy may still be running and must not be doubled.
+RETRY_STATUSES = {502, 503}
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend that has been failing consistently."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds. After that a single probe call is let through:
+    success closes the circuit again, failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(f"{self.name} circuit is open, retry in {retry_in:.0f}s")
+        if state == "half_open":
+            self._probing = True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"✅ {self.name} circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        # The probe was cancelled without an outcome; let the next call probe instead
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.error(f"⚠️ {self.name} circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+
+class AIServiceClient:
+    """
+    Long-lived async client for one AI backend: a keep-alive connection pool,
+    retries with exponential backoff and full jitter, and a circuit breaker.
+    """
+
+    def __init__(self, name: str, max_connections: int = 10, read_timeout: float = 600,
+                 connect_timeout: float = 10, retries: int = 2, backoff: float = 1.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def _send(self, method: str, url: str, retry: bool, **kwargs) -> httpx.Response:
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if not isinstance(e, RETRY_ERRORS) or attempt + 1 >= attempts:
+                    raise
+                logger.warning(f"{self.name} {url} failed ({e!r}), retrying...")
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            else:
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if response.status_code not in RETRY_STATUSES or attempt + 1 >= attempts:
+                    return response
+                logger.warning(f"{self.name} {url} returned {response.status_code}, retrying...")
+            # Full jitter keeps retries from many tasks from arriving in lockstep
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def post_json(self, url: str, payload: dict) -> httpx.Response:
+        return await self._send("POST", url, retry=True, json=payload)
+
+    async def post_files(self, url: str, files: dict, data: dict = None) -> httpx.Response:
+        # File objects are rewound by httpx, so buffered uploads can be retried
+        return await self._send("POST", url, retry=True, files=files, data=data)
+
+    async def post_stream(self, url: str, content, headers: dict) -> httpx.Response:
+        # A streamed body cannot be replayed, so it gets exactly one attempt
+        return await self._send("POST", url, retry=False, content=content, headers=headers)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """
+        Opens a streaming response (e.g. Server-Sent Events) for one attempt.
+        The breaker judges the status line; the body is read by the caller.
+        """
+        self.breaker.before_call()
+        try:
+            async with self.client.stream(method, url, **kwargs) as response:
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                yield response
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,104 @@
+"""
+Startup benchmark for the scraper API.
+
+Measures, over several fresh interpreter runs:
+  * import time  - `import main` in a new process
+  * boot time    - launching uvicorn until GET /health answers
+
+    python benchmarks/startup_benchmark.py --runs 5
+    python benchmarks/startup_benchmark.py --importtime   # slowest imported modules
+
+Run it before and after touching module-level imports or the lifespan hook;
+readiness of autoscaled replicas is bounded by the boot number.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import() -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_boot(timeout: float) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as res:
+                    if res.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError(f"API not ready after {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def slowest_imports(limit: int):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=REPO, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    for cumulative, module in sorted(rows, reverse=True)[:limit]:
+        print(f"{cumulative / 1e6:8.3f}s {module}")
+
+
+def summarize(samples: list) -> dict:
+    return {
+        "min": round(min(samples), 3),
+        "median": round(statistics.median(samples), 3),
+        "max": round(max(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--skip-boot", action="store_true", help="only measure import time")
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports and exit")
+    args = parser.parse_args()
+
+    if args.importtime:
+        slowest_imports(15)
+        return
+
+    # Keep benchmark runs from touching the real job database
+    os.environ.setdefault("JOB_DB_PATH", str(REPO / "benchmarks" / "startup_bench.db"))
+    report = {"runs": args.runs, "import_seconds": summarize([measure_import() for _ in range(args.runs)])}
+    if not args.skip_boot:
+        report["boot_seconds"] = summarize([measure_boot(args.timeout) for _ in range(args.runs)])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
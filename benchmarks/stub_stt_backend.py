@@ -0,0 +1,86 @@
+"""
+Local stand-in for the Whisper box behind whisper_services (STT_BACKEND_URL).
+
+Accepts the same multipart POST, sleeps in proportion to the audio length and
+answers {"text": ...}. Failures can be injected to exercise retries.
+
+    python benchmarks/stub_stt_backend.py --port 5055 --latency-per-audio-second 0.05 --error-rate 0.1
+    STT_BACKEND_URL=http://127.0.0.1:5055/whisper python whisper_services.py
+"""
+import random
+import struct
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Rough bytes per second of 16kHz mono audio, for formats without a cheap length field
+BYTES_PER_SECOND = {"audio/flac": 16000, "audio/ogg": 3000, "audio/wav": 32000}
+
+
+def audio_seconds(data: bytes, content_type: str) -> float:
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        # Walk the chunks to the 'data' size; byte rate comes from 'fmt '
+        offset, byte_rate = 12, 32000
+        while offset + 8 <= len(data):
+            chunk_id, size = struct.unpack("<4sI", data[offset:offset + 8])
+            if chunk_id == b"fmt ":
+                byte_rate = struct.unpack("<I", data[offset + 16:offset + 20])[0] or 32000
+            elif chunk_id == b"data":
+                return min(size, len(data) - offset - 8) / byte_rate
+            offset += 8 + size
+    return len(data) / BYTES_PER_SECOND.get(content_type, 32000)
+
+
+def create_app(args) -> FastAPI:
+    app = FastAPI(title="Stub STT backend")
+    # A CPU Whisper box only transcribes a few files at once
+    slots = asyncio.Semaphore(args.workers)
+    stats = {"requests": 0, "errors": 0, "audio_seconds": 0.0}
+
+    @app.post("/whisper")
+    async def whisper(request: Request):
+        form = await request.form()
+        upload = form["file"]
+        data = await upload.read()
+        content_type = upload.content_type or "audio/wav"
+        stats["requests"] += 1
+        if content_type in args.reject_formats:
+            return JSONResponse({"error": f"unsupported format {content_type}"}, status_code=415)
+        if random.random() < args.error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": "injected failure"}, status_code=args.error_status)
+        seconds = audio_seconds(data, content_type)
+        async with slots:
+            await asyncio.sleep(args.base_latency + seconds * args.latency_per_audio_second)
+        stats["audio_seconds"] += seconds
+        return {"text": f"stub transcript of {seconds:.1f}s ({upload.filename})"}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--latency-per-audio-second", type=float, default=0.05,
+                        help="simulated transcription seconds per second of audio")
+    parser.add_argument("--base-latency", type=float, default=0.05, help="fixed seconds per request")
+    parser.add_argument("--workers", type=int, default=4, help="requests transcribed at once")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--reject-formats", default="", help="comma-separated content types answered with 415")
+    args = parser.parse_args(argv)
+    args.reject_formats = {fmt.strip() for fmt in args.reject_formats.split(",") if fmt.strip()}
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
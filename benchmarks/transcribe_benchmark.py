@@ -0,0 +1,203 @@
+"""
+Load benchmark for whisper_services /transcribe against a local stub backend.
+
+Starts benchmarks/stub_stt_backend.py and whisper_services under uvicorn,
+generates WAV files of several lengths (tone bursts separated by silence so
+segmentation has pauses to cut on) and fires them at /transcribe at each
+concurrency level. Per scenario it reports:
+  * requests/sec and p50/p95 latency
+  * ffmpeg conversion time (from stt_ffmpeg_seconds on /metrics)
+  * peak RSS of the whisper_services process (VmHWM, Linux only)
+
+    python benchmarks/transcribe_benchmark.py --durations 10,60,300 --concurrency 1,4,8
+    python benchmarks/transcribe_benchmark.py --latency-per-audio-second 0.1 --error-rate 0.05
+
+Requires ffmpeg on PATH. The transcript cache is disabled for the service so
+repeated uploads of the same file are really converted and transcribed.
+"""
+import os
+import sys
+import json
+import math
+import time
+import array
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+import httpx
+
+REPO = Path(__file__).resolve().parent.parent
+SAMPLE_RATE = 16000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_wav(path: Path, seconds: int):
+    """Mono 16kHz PCM: 4s of a 440Hz tone then 1s of silence, repeated."""
+    tone = array.array("h", (int(8000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)) for i in range(SAMPLE_RATE)))
+    silence = array.array("h", bytes(2 * SAMPLE_RATE))
+    data_size = seconds * SAMPLE_RATE * 2
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + (36 + data_size).to_bytes(4, "little") + b"WAVE")
+        f.write(b"fmt " + (16).to_bytes(4, "little") + (1).to_bytes(2, "little") + (1).to_bytes(2, "little"))
+        f.write(SAMPLE_RATE.to_bytes(4, "little") + (SAMPLE_RATE * 2).to_bytes(4, "little"))
+        f.write((2).to_bytes(2, "little") + (16).to_bytes(2, "little"))
+        f.write(b"data" + data_size.to_bytes(4, "little"))
+        for second in range(seconds):
+            f.write((silence if second % 5 == 4 else tone).tobytes())
+
+
+def start_server(args: list, port: int, ready_path: str, env: dict, timeout: float = 30.0):
+    proc = subprocess.Popen(
+        [sys.executable, *args, "--host", "127.0.0.1", "--port", str(port)],
+        cwd=REPO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{args[-1]} exited with code {proc.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}{ready_path}", timeout=1)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise TimeoutError(f"{args[-1]} not ready after {timeout}s")
+
+
+def peak_rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def scrape_histogram(text: str, name: str):
+    values = {}
+    for line in text.splitlines():
+        for suffix in ("_sum", "_count"):
+            if line.startswith(name + suffix + " "):
+                values[suffix] = float(line.split()[1])
+    return values.get("_sum", 0.0), values.get("_count", 0.0)
+
+
+async def run_scenario(client: httpx.AsyncClient, url: str, wav: Path, concurrency: int, requests: int) -> dict:
+    data = wav.read_bytes()
+    latencies, statuses = [], {}
+    pending = iter(range(requests))
+
+    async def worker():
+        for _ in pending:
+            started = time.perf_counter()
+            try:
+                res = await client.post(url, files={"file": (wav.name, data, "audio/wav")})
+                status = res.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests_per_second": round(requests / elapsed, 2),
+        "latency_p50": round(statistics.median(latencies), 3),
+        "latency_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "statuses": statuses,
+    }
+
+
+async def run(args, service_port: int, service_pid: int, workdir: Path) -> list:
+    base = f"http://127.0.0.1:{service_port}"
+    report = []
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        for duration in args.durations:
+            wav = workdir / f"bench_{duration}s.wav"
+            write_wav(wav, duration)
+            for concurrency in args.concurrency:
+                before = scrape_histogram((await client.get(f"{base}/metrics")).text, "stt_ffmpeg_seconds")
+                result = await run_scenario(client, f"{base}/transcribe", wav, concurrency, args.requests)
+                after = scrape_histogram((await client.get(f"{base}/metrics")).text, "stt_ffmpeg_seconds")
+                conversions = after[1] - before[1]
+                result.update({
+                    "audio_seconds": duration,
+                    "concurrency": concurrency,
+                    "ffmpeg_seconds_avg": round((after[0] - before[0]) / conversions, 3) if conversions else None,
+                    "peak_rss_mb": peak_rss_mb(service_pid),
+                })
+                print(json.dumps(result), flush=True)
+                report.append(result)
+    return report
+
+
+def parse_ints(value: str) -> list:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=parse_ints, default=[10, 60, 300], help="audio lengths in seconds")
+    parser.add_argument("--concurrency", type=parse_ints, default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=8, help="requests per scenario")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--latency-per-audio-second", type=float, default=0.05)
+    parser.add_argument("--base-latency", type=float, default=0.05)
+    parser.add_argument("--backend-workers", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--reject-formats", default="", help="content types the stub answers with 415")
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None:
+        sys.exit("ffmpeg not found on PATH")
+
+    stub_port, service_port = free_port(), free_port()
+    env = dict(os.environ)
+    env.update({
+        "STT_BACKEND_URL": f"http://127.0.0.1:{stub_port}/whisper",
+        "TRANSCRIPT_CACHE_ENABLED": "false",
+    })
+    stub = start_server([
+        "benchmarks/stub_stt_backend.py",
+        "--latency-per-audio-second", str(args.latency_per_audio_second),
+        "--base-latency", str(args.base_latency),
+        "--workers", str(args.backend_workers),
+        "--error-rate", str(args.error_rate),
+        "--reject-formats", args.reject_formats,
+    ], stub_port, "/stats", env)
+    service = None
+    try:
+        service = start_server(["-m", "uvicorn", "whisper_services:app", "--log-level", "warning"],
+                               service_port, "/metrics", env)
+        with tempfile.TemporaryDirectory() as workdir:
+            report = asyncio.run(run(args, service_port, service.pid, Path(workdir)))
+        backend = httpx.get(f"http://127.0.0.1:{stub_port}/stats").json()
+        print(json.dumps({"backend": backend}))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"scenarios": report, "backend": backend}, f, indent=2)
+    finally:
+        for proc in (service, stub):
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import json
+import uuid
+import threading
+
+
+class DiskCache:
+    """
+    JSON values stored one file per key under `directory`.
+
+    Total size is capped at `max_bytes`: when a write goes over, the least
+    recently used entries (oldest mtime; reads touch the file) are deleted
+    until the cache is back under 90% of the cap. Several processes may share
+    a directory; each only tracks the size it has seen, which is re-synced
+    from disk on every eviction pass.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key: str) -> str:
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        # Write-then-rename so readers never see a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(data)
+            over = self._size > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            size = sum(entry[2] for entry in entries)
+            target = self.max_bytes * 0.9
+            for path, _, entry_size in entries:
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+                self.evictions += 1
+            self._size = size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
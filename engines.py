@@ -0,0 +1,63 @@
+import time
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger("EngineRegistry")
+
+# platform -> (module, class). Modules pull in selenium, undetected_chromedriver,
+# instaloader and textblob, so nothing is imported until a platform is used.
+ENGINE_SPECS = {
+    "youtube": ("scrapers.youtube", "YouTubeScraperEngine"),
+    "instagram": ("scrapers.instagram", "InstagramScraperEngine"),
+    "twitter": ("scrapers.twitter", "TwitterScraperEngine"),
+    "reddit": ("scrapers.reddit", "RedditScraperEngine"),
+}
+ALIASES = {"x": "twitter"}
+# Unknown platforms have always been handed to the Reddit engine
+DEFAULT_PLATFORM = "reddit"
+
+
+class EngineRegistry:
+    """
+    Imports and constructs each platform scraper engine on first use.
+
+    Construction can block (driver setup, Instaloader session loading), so
+    callers should use get() from a worker thread. Each platform has its own
+    lock: two tasks racing for the same engine build it once, while different
+    platforms build in parallel.
+    """
+
+    def __init__(self, specs: dict = None):
+        self.specs = specs or ENGINE_SPECS
+        self._engines = {}
+        self._locks = {platform: threading.Lock() for platform in self.specs}
+
+    def resolve(self, platform: str) -> str:
+        platform = ALIASES.get(platform.lower(), platform.lower())
+        return platform if platform in self.specs else DEFAULT_PLATFORM
+
+    def get(self, platform: str):
+        platform = self.resolve(platform)
+        engine = self._engines.get(platform)
+        if engine is not None:
+            return engine
+        with self._locks[platform]:
+            if platform not in self._engines:
+                module_name, class_name = self.specs[platform]
+                started = time.perf_counter()
+                engine_cls = getattr(importlib.import_module(module_name), class_name)
+                self._engines[platform] = engine_cls()
+                logger.info(f"✅ {class_name} ready in {time.perf_counter() - started:.2f}s")
+            return self._engines[platform]
+
+    def warm_up(self, platforms):
+        """Builds the given engines ahead of the first request; failures are only logged."""
+        for platform in platforms:
+            try:
+                self.get(platform)
+            except Exception as e:
+                logger.error(f"⚠️ Warm-up of {platform} engine failed: {e}")
+
+    def loaded(self) -> list:
+        return sorted(self._engines)
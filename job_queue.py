@@ -0,0 +1,331 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger("JobQueue")
+
+
+class QueueFullError(Exception):
+    """Raised by enqueue() when the number of pending jobs hits the configured limit."""
+
+
+class JobQueue:
+    """
+    Durable SQLite-backed job queue with leases.
+
+    Workers lease the oldest queued job and must renew the lease while it runs.
+    A job whose lease expires (worker crashed, API restarted) goes back to the
+    queue, up to `max_attempts` times, so a restart no longer loses work.
+
+    Batch jobs are queued at a lower priority than single requests and are
+    capped separately by `max_batch_pending`. Archive jobs (kind "archive") run
+    after both, so deferred video archiving survives restarts without delaying
+    analyses.
+
+    Finished jobs and batches older than `retention_seconds` are deleted by the
+    lease sweep, at most once per `prune_interval` (0 keeps everything).
+    """
+
+    def __init__(self, db_path: str, max_pending: int = 500, lease_seconds: int = 120, max_attempts: int = 3,
+                 max_batch_pending: int = 20000, retention_seconds: float = 0, prune_interval: float = 600):
+        self.db_path = db_path
+        self.max_pending = max_pending
+        self.max_batch_pending = max_batch_pending
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+        self._local = threading.local()
+        self._init_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are bound to their thread; executor threads each get one
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                task_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+            CREATE TABLE IF NOT EXISTS batch_items (
+                batch_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                task_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                cached INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (batch_id, position)
+            );
+        """)
+        # Older databases lack the columns added for coalescing and batches
+        columns = {row["name"] for row in self._conn().execute("PRAGMA table_info(jobs)")}
+        if "canonical_id" not in columns:
+            self._conn().execute("ALTER TABLE jobs ADD COLUMN canonical_id TEXT")
+        if "priority" not in columns:
+            self._conn().execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        if "kind" not in columns:
+            self._conn().execute("ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'analysis'")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS idx_jobs_canonical ON jobs(canonical_id, status)")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS idx_jobs_runnable ON jobs(status, priority, created_at)")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS idx_batch_items_task ON batch_items(task_id)")
+
+    @staticmethod
+    def _active_task(conn, canonical_id: str):
+        row = conn.execute(
+            "SELECT task_id FROM jobs WHERE canonical_id = ? AND status IN ('queued', 'running') "
+            "ORDER BY created_at LIMIT 1",
+            (canonical_id,)
+        ).fetchone()
+        return row["task_id"] if row else None
+
+    def enqueue(self, url: str, platform: str, task_id: str = None, canonical_id: str = None):
+        """
+        Queues a job and returns (task_id, created). When a queued or running job
+        already exists for `canonical_id`, its task_id is returned with created=False
+        instead of starting a duplicate; the check and insert share one transaction.
+        """
+        task_id = task_id or str(uuid.uuid4())
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            active = self._active_task(conn, canonical_id) if canonical_id else None
+            if active:
+                conn.execute("COMMIT")
+                return active, False
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running') AND priority = 0"
+            ).fetchone()[0]
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({pending} pending jobs)")
+            conn.execute(
+                "INSERT INTO jobs (task_id, url, platform, canonical_id, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (task_id, url, platform, canonical_id, now, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return task_id, True
+
+    def enqueue_batch(self, batch_id: str, items: list) -> dict:
+        """
+        Queues a whole batch in one transaction. Each item is a dict with url,
+        platform, canonical_id and optionally cached_task_id (an already stored
+        result). Items coalesce onto active jobs like enqueue() does, including
+        duplicates inside the batch. Returns counts of queued/deduplicated/cached.
+        """
+        now = time.time()
+        counts = {"queued": 0, "deduplicated": 0, "cached": 0}
+        links = []
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for position, item in enumerate(items):
+                if item.get("cached_task_id"):
+                    links.append((batch_id, position, item["cached_task_id"], item["url"], item["platform"], 1, now))
+                    counts["cached"] += 1
+                    continue
+                task_id = self._active_task(conn, item["canonical_id"])
+                if task_id:
+                    counts["deduplicated"] += 1
+                else:
+                    task_id = str(uuid.uuid4())
+                    conn.execute(
+                        "INSERT INTO jobs (task_id, url, platform, canonical_id, priority, status, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, 1, 'queued', ?, ?)",
+                        (task_id, item["url"], item["platform"], item["canonical_id"], now, now)
+                    )
+                    counts["queued"] += 1
+                links.append((batch_id, position, task_id, item["url"], item["platform"], 0, now))
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running') AND priority = 1"
+            ).fetchone()[0]
+            if pending > self.max_batch_pending:
+                raise QueueFullError(f"Batch queue is full ({pending} pending batch jobs including this batch)")
+            conn.executemany(
+                "INSERT INTO batch_items (batch_id, position, task_id, url, platform, cached, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                links
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return counts
+
+    def enqueue_archive(self, task_id: str, url: str, platform: str) -> str:
+        """
+        Queues archiving the full video of a finished task, below every analysis.
+        The job keeps the page URL, so its media URL is resolved fresh when it runs.
+        """
+        archive_id = f"{task_id}:archive"
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR IGNORE INTO jobs (task_id, url, platform, kind, priority, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'archive', 2, 'queued', ?, ?)",
+            (archive_id, url, platform, now, now)
+        )
+        return archive_id
+
+    def batch_progress(self, batch_id: str):
+        """Aggregate status counts for a batch, overall and per platform; None if unknown."""
+        rows = self._conn().execute(
+            "SELECT b.platform, CASE WHEN b.cached THEN 'cached' ELSE COALESCE(j.status, 'unknown') END AS status, "
+            "COUNT(*) AS n FROM batch_items b LEFT JOIN jobs j ON j.task_id = b.task_id "
+            "WHERE b.batch_id = ? GROUP BY 1, 2",
+            (batch_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        totals, by_platform = {}, {}
+        for row in rows:
+            totals[row["status"]] = totals.get(row["status"], 0) + row["n"]
+            platform_counts = by_platform.setdefault(row["platform"], {})
+            platform_counts[row["status"]] = row["n"]
+        return {"counts": totals, "by_platform": by_platform}
+
+    def batch_tasks(self, batch_id: str) -> list:
+        rows = self._conn().execute(
+            "SELECT b.position, b.url, b.platform, b.task_id, "
+            "CASE WHEN b.cached THEN 'cached' ELSE j.status END AS status "
+            "FROM batch_items b LEFT JOIN jobs j ON j.task_id = b.task_id "
+            "WHERE b.batch_id = ? ORDER BY b.position",
+            (batch_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def lease(self, worker_id: str, platform_limits: dict = None, archive_limit: int = None):
+        """
+        Claims the next runnable job for `worker_id`, or returns None if there is none.
+        Single requests go before batch jobs; platforms already running
+        `platform_limits[platform]` analyses (across all workers) are skipped, and
+        archive jobs are skipped while `archive_limit` of them are running.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs that keep losing their lease are given up on instead of retried forever
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Lease expired too many times', updated_at = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            if self.retention_seconds and now >= self._next_prune:
+                self._next_prune = now + self.prune_interval
+                self._prune(conn, now - self.retention_seconds)
+            saturated = []
+            if platform_limits:
+                running = dict(conn.execute(
+                    "SELECT platform, COUNT(*) FROM jobs WHERE status = 'running' AND lease_expires >= ? "
+                    "AND kind != 'archive' GROUP BY platform",
+                    (now,)
+                ).fetchall())
+                saturated = [p for p, limit in platform_limits.items() if running.get(p, 0) >= limit]
+            # Archives only count against archive_limit, never against a platform's analyses
+            skip = f"AND (kind = 'archive' OR platform NOT IN ({','.join('?' * len(saturated))})) " if saturated else ""
+            if archive_limit is not None:
+                archiving = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'running' AND lease_expires >= ? AND kind = 'archive'",
+                    (now,)
+                ).fetchone()[0]
+                if archiving >= archive_limit:
+                    skip += "AND kind != 'archive' "
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' OR (status = 'running' AND lease_expires < ?)) "
+                f"{skip}ORDER BY priority, created_at LIMIT 1",
+                (now, *saturated)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE task_id = ?",
+                (worker_id, now + self.lease_seconds, now, row["task_id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row["status"] == "running":
+            logger.warning(f"[{row['task_id']}] Re-leasing job after expired lease (attempt {row['attempts'] + 1})")
+        return dict(row)
+
+    @staticmethod
+    def _prune(conn, cutoff: float):
+        # A batch goes once none of its jobs is active and the last one ended before the cutoff
+        batches = conn.execute(
+            "DELETE FROM batch_items WHERE batch_id IN ("
+            "SELECT b.batch_id FROM batch_items b LEFT JOIN jobs j ON j.task_id = b.task_id AND b.cached = 0 "
+            "GROUP BY b.batch_id HAVING MAX(b.created_at) < ? AND COALESCE(MAX(j.updated_at), 0) < ? "
+            "AND COALESCE(SUM(j.status IN ('queued', 'running')), 0) = 0)",
+            (cutoff, cutoff)
+        ).rowcount
+        # Jobs still listed by a kept batch stay, so its progress never turns into "unknown"
+        jobs = conn.execute(
+            "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ? "
+            "AND task_id NOT IN (SELECT task_id FROM batch_items)",
+            (cutoff,)
+        ).rowcount
+        if batches or jobs:
+            logger.info(f"Pruned {jobs} finished jobs and {batches} batch items older than the retention window")
+
+    def heartbeat(self, task_id: str, worker_id: str) -> bool:
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+            "WHERE task_id = ? AND lease_owner = ? AND status = 'running'",
+            (now + self.lease_seconds, now, task_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def set_stage(self, task_id: str, stage: str):
+        self._conn().execute(
+            "UPDATE jobs SET stage = ?, updated_at = ? WHERE task_id = ?",
+            (stage, time.time(), task_id)
+        )
+
+    def finish(self, task_id: str, status: str, error: str = None, worker_id: str = None) -> bool:
+        """Records the outcome; with `worker_id`, only while that worker still holds the lease."""
+        sql = ("UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+               "WHERE task_id = ?")
+        params = [status, error, time.time(), task_id]
+        if worker_id is not None:
+            sql += " AND lease_owner = ?"
+            params.append(worker_id)
+        return self._conn().execute(sql, params).rowcount == 1
+
+    def get(self, task_id: str):
+        row = self._conn().execute("SELECT * FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def depth(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
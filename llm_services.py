@@ -1,7 +1,112 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-import requests
-from typing import Optional
+from contextlib import asynccontextmanager
+import httpx
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+from typing import List, Optional
+
+import metrics
+from admission import AdmissionGate, AdmissionRejected
+from disk_cache import DiskCache
+from prompt_cache import PromptCache
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+# Completions run LLM_SLOTS at a time (the llama.cpp server's --parallel); up to
+# LLM_QUEUE_MAX more wait and the rest get a 429. LLM_DEADLINE_SECONDS bounds
+# queue wait plus generation for a single completion
+LLM_SLOTS = int(os.getenv("LLM_SLOTS", "4"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "32"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "180"))
+
+# Long transcripts are summarized map-reduce style: split into chunks of about
+# SUMMARY_CHUNK_TOKENS, summarized at most SUMMARY_PARALLELISM at a time per
+# request (so one long transcript cannot fill the LLM queue on its own), then
+# merged, recursively if the merged summaries are still too long for one prompt
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "2048"))
+SUMMARY_PARALLELISM = int(os.getenv("SUMMARY_PARALLELISM", str(LLM_SLOTS)))
+SUMMARY_MAX_DEPTH = int(os.getenv("SUMMARY_MAX_DEPTH", "3"))
+# Fallback when the backend cannot tokenize; ~4 characters per token for English
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+
+# Completions are cached by (normalized prompt, sampling parameters, model id) in
+# memory and on disk. Sampled completions (temperature > 0) are only cached for
+# callers that opt in, e.g. chunk summaries so a retry only recomputes what failed
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "4096"))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "llm"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Part of the cache key; resolved from the backend's /v1/models when unset.
+# A failed lookup is retried at most every LLM_MODEL_ID_RETRY_SECONDS
+LLM_MODEL_ID = os.getenv("LLM_MODEL_ID")
+LLM_MODEL_ID_RETRY_SECONDS = float(os.getenv("LLM_MODEL_ID_RETRY_SECONDS", "60"))
+
+SUMMARY_PROMPT = "Provide a concise summary of this text: {text}"
+CHUNK_PROMPT = "Summarize this part of a longer transcript in a few sentences, keeping names, facts and numbers: {text}"
+MERGE_PROMPT = "These are summaries of consecutive parts of one transcript. Combine them into one concise summary: {text}"
+# /analyze: summary, sentiment and keywords from one prompt evaluation, with the
+# output constrained to ANALYSIS_SCHEMA by llama.cpp's json_schema grammar
+ANALYSIS_PROMPT = (
+    "Analyze this {kind}. Respond with a JSON object containing a concise summary, "
+    "the overall sentiment (Positive, Negative or Neutral) and up to 8 keywords: {text}"
+)
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "sentiment": {"type": "string", "enum": ["Positive", "Negative", "Neutral"]},
+        "keywords": {"type": "array", "items": {"type": "string"}, "maxItems": 8},
+    },
+    "required": ["summary", "sentiment", "keywords"],
+}
+ANALYSIS_TOKENS = int(os.getenv("ANALYSIS_TOKENS", "384"))
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Sentiment is classified many texts per completion: deduplicated texts are packed
+# SENTIMENT_BATCH_SIZE (and at most SENTIMENT_BATCH_CHARS) to a numbered-list
+# prompt. Single /sentiment calls arriving within SENTIMENT_BATCH_WAIT_MS of
+# each other share a completion too
+SENTIMENT_LABELS = ["Positive", "Negative", "Neutral"]
+SENTIMENT_TEXT_CHARS = int(os.getenv("SENTIMENT_TEXT_CHARS", "1000"))
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
+SENTIMENT_BATCH_CHARS = int(os.getenv("SENTIMENT_BATCH_CHARS", "6000"))
+# Sentiment batches in flight at once per request; thousands of comments wait here instead of overflowing the LLM queue
+SENTIMENT_PARALLELISM = int(os.getenv("SENTIMENT_PARALLELISM", str(LLM_SLOTS)))
+SENTIMENT_BATCH_WAIT_MS = float(os.getenv("SENTIMENT_BATCH_WAIT_MS", "5"))
+SENTIMENT_BATCH_MAX_TEXTS = int(os.getenv("SENTIMENT_BATCH_MAX_TEXTS", "10000"))
+SENTIMENT_BATCH_PROMPT = (
+    "Classify the sentiment of each of these {count} numbered texts as Positive, Negative or Neutral. "
+    "Respond with a JSON array of {count} labels in the same order.\n{texts}"
+)
+NUMBERED_LABEL = re.compile(r"^\s*(\d+)[.):]\s*(Positive|Negative|Neutral)", re.IGNORECASE | re.MULTILINE)
+
+REQUEST_SECONDS = metrics.Histogram("llm_request_seconds", "LLM backend latency per task")
+INFLIGHT = metrics.Gauge("llm_inflight_requests", "LLM backend calls currently running")
+FAILURES = metrics.Counter("llm_failures_total", "LLM backend calls that failed")
+PROMPT_TOKENS = metrics.Counter("llm_prompt_tokens_total", "Prompt tokens evaluated by the backend")
+PREDICTED_TOKENS = metrics.Counter("llm_predicted_tokens_total", "Tokens generated by the backend")
+TOKENS_PER_SECOND = metrics.Histogram(
+    "llm_tokens_per_second", "Backend throughput reported by llama.cpp (phase = prompt | predicted)",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+SUMMARY_CHUNKS = metrics.Histogram(
+    "llm_summary_chunks", "Chunks a /summary text was split into",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+SENTIMENT_BATCH_TEXTS = metrics.Histogram(
+    "llm_sentiment_batch_texts", "Texts per sentiment classification (source = request | coalesced)",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 512, 2048)
+)
+QUEUE_SECONDS = metrics.Histogram("llm_queue_seconds", "Time a completion waited for a backend slot")
+QUEUE_WAITING = metrics.Gauge("llm_queue_waiting", "Completions waiting for a backend slot")
+REJECTED = metrics.Counter("llm_rejected_total", "Completions turned away with 429 because the queue was full")
+CACHE_LOOKUPS = metrics.Counter("llm_cache_lookups_total", "Completion cache lookups by result (memory | disk | miss | bypass)")
+CACHE_SAVED_TOKENS = metrics.Counter("llm_cache_saved_tokens_total", "Prompt and predicted tokens not recomputed thanks to the cache")
 
 # 1. Define Request/Response Schemas (The "Contract" for other projects)
 class TextRequest(BaseModel):
@@ -15,50 +120,419 @@ class AnalysisResponse(BaseModel):
     task: str
     result: str
 
+class StructuredAnalysis(BaseModel):
+    summary: str
+    sentiment: str
+    keywords: List[str]
+
+class CombinedAnalysisResponse(BaseModel):
+    task: str
+    result: StructuredAnalysis
+
+class SentimentBatchRequest(BaseModel):
+    texts: List[str]
+
+class SentimentBatchResponse(BaseModel):
+    task: str
+    results: List[str]
+
 # 2. Re-wrap your logic into a Service Class
 class LLMService:
-    def __init__(self, api_url: str):
+    """
+    Async llama.cpp client on a keep-alive pool.
+
+    At most `slots` completions run at once (match the server's --parallel),
+    `max_queue` more wait for a slot and anything beyond that is rejected with
+    429. Each completion, queue wait included, must finish within `deadline`
+    seconds or the request is cancelled and answered with 504.
+    """
+
+    def __init__(self, api_url: str, cache: PromptCache = None, model_id: str = None,
+                 slots: int = 4, max_queue: int = 32, deadline: float = 180.0):
         self.url = api_url
+        self.cache = cache
+        self.deadline = deadline
+        self.gate = AdmissionGate("llm", slots, max_queue)
+        self.client = None
+        self._model_id = model_id
+        self._model_id_retry_at = 0.0
+
+    def open(self):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0),
+            limits=httpx.Limits(max_connections=self.gate.max_concurrency + 4, max_keepalive_connections=self.gate.max_concurrency + 4)
+        )
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+    def _base_url(self) -> str:
+        return self.url.rsplit("/", 1)[0]
+
+    async def model_id(self) -> str:
+        if self._model_id is None:
+            if time.monotonic() < self._model_id_retry_at:
+                return "unknown"
+            try:
+                response = await self.client.get(self._base_url() + "/v1/models", timeout=5)
+                response.raise_for_status()
+                self._model_id = response.json()["data"][0]["id"]
+            except Exception:
+                # Not remembered for good, but not asked again on every completion either
+                self._model_id_retry_at = time.monotonic() + LLM_MODEL_ID_RETRY_SECONDS
+                return "unknown"
+        return self._model_id
+
+    async def _cache_key(self, payload: dict) -> str:
+        normalized = dict(payload, prompt=" ".join(payload["prompt"].split()))
+        key = json.dumps({"model": await self.model_id(), "payload": normalized}, sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    async def _complete(self, payload: dict, task: str) -> dict:
+        async with self.gate.slot() as queue_seconds:
+            QUEUE_SECONDS.observe(queue_seconds, task=task)
+            started = time.perf_counter()
+            INFLIGHT.inc(task=task)
+            try:
+                response = await self.client.post(self.url, json=payload)
+                response.raise_for_status()
+                return response.json()
+            finally:
+                INFLIGHT.dec(task=task)
+                REQUEST_SECONDS.observe(time.perf_counter() - started, task=task)
 
-    def _call_llm(self, prompt: str, tokens: int = 256) -> str:
+    async def _call_llm(self, prompt: str, tokens: int = 256, task: str = "generic", options: dict = None,
+                        cache: bool = False, validate=None) -> str:
+        """
+        `cache=True` opts a sampled (temperature > 0) completion into the cache;
+        greedy ones are always cached. `validate(content)` may raise to keep a
+        malformed completion out of it.
+        """
         payload = {
             "prompt": f"User: {prompt}\nAssistant:",
             "n_predict": tokens,
             "temperature": 0.7,
             "stop": ["User:"]
         }
+        # Extra llama.cpp sampling fields, e.g. json_schema or temperature
+        payload.update(options or {})
+        loop = asyncio.get_event_loop()
+        key = None
+        if self.cache is not None:
+            if cache or payload["temperature"] <= 0:
+                key = await self._cache_key(payload)
+                hit, tier = await loop.run_in_executor(None, self.cache.get, key)
+                CACHE_LOOKUPS.inc(task=task, result=tier or "miss")
+                if hit is not None:
+                    CACHE_SAVED_TOKENS.inc(hit.get("tokens", 0), task=task)
+                    return hit["content"]
+            else:
+                self.cache.bypass()
+                CACHE_LOOKUPS.inc(task=task, result="bypass")
         try:
-            response = requests.post(self.url, json=payload, timeout=30)
-            response.raise_for_status()
-            return response.json().get("content", "").strip()
+            # Cancelling on the deadline closes the connection, which stops llama.cpp generating
+            body = await asyncio.wait_for(self._complete(payload, task), self.deadline)
+        except AdmissionRejected as e:
+            REJECTED.inc(task=task)
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        except asyncio.TimeoutError:
+            FAILURES.inc(task=task)
+            raise HTTPException(status_code=504, detail=f"LLM did not answer within {self.deadline:g}s")
         except Exception as e:
+            FAILURES.inc(task=task)
             raise HTTPException(status_code=500, detail=f"LLM Backend Error: {str(e)}")
+        timings = body.get("timings") or {}
+        self._record_timings(timings, task)
+        content = body.get("content", "").strip()
+        if validate:
+            validate(content)
+        if key is not None:
+            value = {"content": content, "tokens": timings.get("prompt_n", 0) + timings.get("predicted_n", 0)}
+            await loop.run_in_executor(None, self.cache.set, key, value)
+        return content
+
+    async def count_tokens(self, text: str) -> Optional[int]:
+        """Token count from the llama.cpp /tokenize endpoint, or None if it is unavailable."""
+        try:
+            response = await self.client.post(self._base_url() + "/tokenize", json={"content": text}, timeout=10)
+            response.raise_for_status()
+            return len(response.json()["tokens"])
+        except Exception:
+            return None
+
+    @staticmethod
+    def _record_timings(timings: dict, task: str):
+        # llama.cpp's /completion reports per-phase token counts and speeds
+        PROMPT_TOKENS.inc(timings.get("prompt_n", 0), task=task)
+        PREDICTED_TOKENS.inc(timings.get("predicted_n", 0), task=task)
+        if timings.get("prompt_per_second"):
+            TOKENS_PER_SECOND.observe(timings["prompt_per_second"], task=task, phase="prompt")
+        if timings.get("predicted_per_second"):
+            TOKENS_PER_SECOND.observe(timings["predicted_per_second"], task=task, phase="predicted")
 
 # 3. Initialize FastAPI and the Service
-app = FastAPI(title="LLM Analysis Service", description="A shared API for text tasks")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    llm_client.open()
+    try:
+        yield
+    finally:
+        await llm_client.aclose()
+
+app = FastAPI(title="LLM Analysis Service", description="A shared API for text tasks", lifespan=lifespan)
 # Update this IP to your actual local LLM endpoint
-llm_client = LLMService(api_url="http://10.94.157.37:8080/completion")
+prompt_cache = PromptCache(LLM_CACHE_MEMORY_ENTRIES, DiskCache(LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES)) if LLM_CACHE_ENABLED else None
+llm_client = LLMService(
+    api_url="http://10.94.157.37:8080/completion", cache=prompt_cache, model_id=LLM_MODEL_ID,
+    slots=LLM_SLOTS, max_queue=LLM_QUEUE_MAX, deadline=LLM_DEADLINE_SECONDS
+)
+
+def split_chunks(text: str, max_chars: int) -> list:
+    """Packs whole sentences into chunks of at most max_chars; unpunctuated runs are cut at spaces."""
+    pieces = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            pieces.append(sentence)
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def cached_completion(prompt: str, tokens: int = 256, task: str = "summarization",
+                            options: dict = None, validate=None) -> str:
+    """One LLM call, opted into the completion cache."""
+    return await llm_client._call_llm(prompt, tokens, task, options, cache=True, validate=validate)
+
+async def summarize_chunks(chunks: list, slots: asyncio.Semaphore) -> list:
+    async def summarize_bounded(chunk):
+        async with slots:
+            return await cached_completion(CHUNK_PROMPT.format(text=chunk))
+
+    # Every chunk runs to completion so the successful ones are cached before a failure is raised
+    results = await asyncio.gather(*(summarize_bounded(chunk) for chunk in chunks), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+async def condense(text: str):
+    """
+    Returns (text, False) when the text fits in one prompt; otherwise the chunk
+    summaries, merged down until they fit, and True.
+    """
+    tokens = await llm_client.count_tokens(text)
+    chars_per_token = len(text) / tokens if tokens else CHARS_PER_TOKEN
+    max_chars = max(1, int(SUMMARY_CHUNK_TOKENS * chars_per_token))
+    if len(text) <= max_chars:
+        SUMMARY_CHUNKS.observe(1)
+        return text, False
+
+    chunks = split_chunks(text, max_chars)
+    SUMMARY_CHUNKS.observe(len(chunks))
+    # Per request, so other requests' completions still meet the admission queue and deadline
+    slots = asyncio.Semaphore(SUMMARY_PARALLELISM)
+    summaries = await summarize_chunks(chunks, slots)
+    for _ in range(SUMMARY_MAX_DEPTH):
+        merged = "\n".join(summaries)
+        if len(merged) <= max_chars:
+            break
+        summaries = await summarize_chunks(split_chunks(merged, max_chars), slots)
+    return "\n".join(summaries)[:max_chars], True
+
+async def map_reduce_summary(text: str) -> str:
+    body, condensed = await condense(text)
+    prompt = MERGE_PROMPT if condensed else SUMMARY_PROMPT
+    return await cached_completion(prompt.format(text=body))
+
+def parse_analysis(content: str) -> dict:
+    # Backends without json_schema support may still wrap the object in prose
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    try:
+        analysis = StructuredAnalysis(**json.loads(match.group(0) if match else content))
+    except Exception:
+        raise HTTPException(status_code=502, detail=f"LLM returned malformed analysis: {content[:200]}")
+    return {"summary": analysis.summary, "sentiment": analysis.sentiment, "keywords": analysis.keywords}
+
+async def combined_analysis(text: str) -> dict:
+    body, condensed = await condense(text)
+    kind = "series of summaries of consecutive parts of one transcript" if condensed else "text"
+    content = await cached_completion(
+        ANALYSIS_PROMPT.format(kind=kind, text=body), ANALYSIS_TOKENS, "analysis",
+        {"json_schema": ANALYSIS_SCHEMA, "temperature": 0.2}, parse_analysis
+    )
+    return parse_analysis(content)
+
+def pack_sentiment_batches(texts: list) -> list:
+    batches, current, chars = [], [], 0
+    for text in texts:
+        if current and (len(current) >= SENTIMENT_BATCH_SIZE or chars + len(text) > SENTIMENT_BATCH_CHARS):
+            batches.append(current)
+            current, chars = [], 0
+        current.append(text)
+        chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_sentiment_labels(content: str, count: int) -> list:
+    """Labels from a JSON array, or from '1. Positive' lines when the backend ignored the schema."""
+    match = re.search(r"\[.*\]", content, re.DOTALL)
+    try:
+        labels = [str(label).strip().capitalize() for label in json.loads(match.group(0))]
+    except Exception:
+        numbered = {int(index): label.capitalize() for index, label in NUMBERED_LABEL.findall(content)}
+        labels = [numbered.get(i) for i in range(1, count + 1)]
+    if len(labels) != count or any(label not in SENTIMENT_LABELS for label in labels):
+        raise HTTPException(status_code=502, detail=f"LLM returned malformed sentiment labels: {content[:200]}")
+    return labels
+
+label_token_cost = None
+
+async def sentiment_token_budget(count: int) -> int:
+    """
+    n_predict for a JSON array of `count` labels: the longest label as an array
+    element ('"Negative", ') measured once with the backend tokenizer, plus one
+    token of slack each and margin for the brackets. Without /tokenize the
+    element's character count stands in, which no tokenizer exceeds.
+    """
+    global label_token_cost
+    if label_token_cost is None:
+        element = json.dumps(max(SENTIMENT_LABELS, key=len)) + ", "
+        label_token_cost = await llm_client.count_tokens(element) or len(element)
+    return (label_token_cost + 1) * count + 16
+
+async def classify_batch(texts: list) -> list:
+    listing = "\n".join(f"{index}. {text}" for index, text in enumerate(texts, 1))
+    schema = {
+        "type": "array", "items": {"type": "string", "enum": SENTIMENT_LABELS},
+        "minItems": len(texts), "maxItems": len(texts),
+    }
+    content = await llm_client._call_llm(
+        SENTIMENT_BATCH_PROMPT.format(count=len(texts), texts=listing), await sentiment_token_budget(len(texts)), "sentiment_batch",
+        {"json_schema": schema, "temperature": 0}, validate=lambda content: parse_sentiment_labels(content, len(texts))
+    )
+    return parse_sentiment_labels(content, len(texts))
+
+async def classify_sentiments(texts: list) -> list:
+    """One label per text; duplicates and empty texts cost nothing."""
+    cleaned = [" ".join(text.split())[:SENTIMENT_TEXT_CHARS] for text in texts]
+    unique = [text for text in dict.fromkeys(cleaned) if text]
+    batches = pack_sentiment_batches(unique)
+    slots = asyncio.Semaphore(SENTIMENT_PARALLELISM)
+
+    async def classify_bounded(batch):
+        async with slots:
+            return await classify_batch(batch)
+
+    results = await asyncio.gather(*(classify_bounded(batch) for batch in batches))
+    labels = {text: label for batch, batch_labels in zip(batches, results) for text, label in zip(batch, batch_labels)}
+    return [labels.get(text, "Neutral") for text in cleaned]
+
+class SentimentBatcher:
+    """
+    Coalesces concurrent single-text sentiment requests: a batch is classified
+    once `max_batch` texts are waiting or `max_delay` seconds after the first
+    one arrived, and every caller gets its own label back.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+        self._runs = set()
+
+    async def classify(self, text: str) -> str:
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(self.max_delay, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        run = asyncio.ensure_future(self._run(batch))
+        self._runs.add(run)
+        run.add_done_callback(self._runs.discard)
+
+    async def _run(self, batch: list):
+        SENTIMENT_BATCH_TEXTS.observe(len(batch), source="coalesced")
+        try:
+            labels = await classify_sentiments([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), label in zip(batch, labels):
+            if not future.done():
+                future.set_result(label)
+
+sentiment_batcher = SentimentBatcher(SENTIMENT_BATCH_SIZE, SENTIMENT_BATCH_WAIT_MS / 1000)
 
 # 4. Define API Endpoints
 @app.post("/summary", response_model=AnalysisResponse)
 async def summarize(request: TextRequest):
-    prompt = f"Provide a concise summary of this text: {request.text}"
-    result = llm_client._call_llm(prompt)
+    result = await map_reduce_summary(request.text)
     return {"task": "summarization", "result": result}
 
+@app.post("/analyze", response_model=CombinedAnalysisResponse)
+async def analyze(request: TextRequest):
+    result = await combined_analysis(request.text)
+    return {"task": "analysis", "result": result}
+
 @app.post("/sentiment", response_model=AnalysisResponse)
 async def sentiment(request: TextRequest):
-    prompt = f"Analyze the sentiment of this text. Reply with only one word (Positive, Negative, or Neutral): {request.text[:1000]}"
-    result = llm_client._call_llm(prompt, tokens=10)
+    # Concurrent callers share completions; repeated texts are answered from the cache
+    result = await sentiment_batcher.classify(request.text)
     return {"task": "sentiment", "result": result}
 
+@app.post("/sentiment/batch", response_model=SentimentBatchResponse)
+async def sentiment_batch(request: SentimentBatchRequest):
+    if len(request.texts) > SENTIMENT_BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"Batches are limited to {SENTIMENT_BATCH_MAX_TEXTS} texts")
+    SENTIMENT_BATCH_TEXTS.observe(len(request.texts), source="request")
+    results = await classify_sentiments(request.texts)
+    return {"task": "sentiment_batch", "results": results}
+
 @app.post("/translate", response_model=AnalysisResponse)
 async def translate(request: TranslationRequest):
     prompt = f"Translate the following text into {request.target_lang}: {request.text}"
-    result = llm_client._call_llm(prompt, tokens=512)
+    result = await llm_client._call_llm(prompt, tokens=512, task="translation")
     return {"task": "translation", "result": result}
 
 # Health check for monitoring
 @app.get("/health")
 async def health():
-    return {"status": "online"}
\ No newline at end of file
+    return {"status": "online"}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    if prompt_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prompt_cache.stats()}
+
+@app.get("/metrics")
+async def get_metrics():
+    QUEUE_WAITING.set(llm_client.gate.waiting)
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
\ No newline at end of file
@@ -371,15 +371,18 @@ import uuid
 import asyncio
 import uvicorn
 import io
+import re
+import json
+import time
+import queue
 import logging
+import httpx
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from contextlib import asynccontextmanager, nullcontext
 from datetime import datetime, timedelta 
 from pathlib import Path
 from dotenv import load_dotenv
 from minio import Minio 
-from yt_dlp import YoutubeDL
 from fastapi import FastAPI, BackgroundTasks, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -405,23 +408,129 @@ DB_STORAGE_IP = "10.94.157.201"
 
 REMOTE_SERVER_URL = f"http://{REMOTE_AI_IP}:8002"
 WHISPER_API_URL = f"http://{REMOTE_AI_IP}:8001/transcribe"
-SUMMARY_API_URL = f"{REMOTE_SERVER_URL}/summary"
-SENTIMENT_API_URL = f"{REMOTE_SERVER_URL}/sentiment"
-
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+# Summary, sentiment and keywords come from one structured completion
+ANALYZE_API_URL = f"{REMOTE_SERVER_URL}/analyze"
+# Re-label scraped comments with the LLM (/sentiment/batch calls of at most
+# COMMENT_SENTIMENT_CHUNK texts, below the service's SENTIMENT_BATCH_MAX_TEXTS)
+# instead of keeping the scrapers' TextBlob labels
+COMMENT_SENTIMENT_LLM = os.getenv("COMMENT_SENTIMENT_LLM", "false").lower() == "true"
+COMMENT_SENTIMENT_CHUNK = int(os.getenv("COMMENT_SENTIMENT_CHUNK", "500"))
+SENTIMENT_BATCH_API_URL = f"{REMOTE_SERVER_URL}/sentiment/batch"
+
+# Consume /transcribe/stream (SSE) and start the LLM analysis on the first
+# EARLY_ANALYSIS_CHARS of transcript while the rest is still being transcribed
+TRANSCRIBE_STREAMING = os.getenv("TRANSCRIBE_STREAMING", "false").lower() == "true"
+WHISPER_STREAM_API_URL = f"{WHISPER_API_URL}/stream"
+EARLY_ANALYSIS_CHARS = int(os.getenv("EARLY_ANALYSIS_CHARS", "4000"))
+
+# Shared keep-alive pools for the AI services, per backend
+AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", "10"))
+AI_RETRIES = int(os.getenv("AI_RETRIES", "2"))
+AI_BREAKER_THRESHOLD = int(os.getenv("AI_BREAKER_THRESHOLD", "5"))
+AI_BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+
+# Streaming mode fans download chunks out to MinIO and Whisper as they arrive
+# instead of buffering the whole video in memory first
+STREAMING_MODE = os.getenv("STREAMING_MODE", "true").lower() == "true"
+VIDEO_FORMAT = 'best[ext=mp4]/best'
+VIDEO_CHUNK_SIZE = 1024 * 1024
+STREAM_QUEUE_CHUNKS = int(os.getenv("STREAM_QUEUE_CHUNKS", "4"))
+MINIO_PART_SIZE = int(os.getenv("MINIO_PART_SIZE", str(5 * 1024 * 1024)))  # S3 minimum part size
+
+# "audio" transcribes from the smallest usable audio-only format and archives the
+# full video to MinIO afterwards at low priority; "video" downloads the full video once
+ACQUISITION_MODE = os.getenv("ACQUISITION_MODE", "audio").lower()
+AUDIO_MIN_ABR = float(os.getenv("AUDIO_MIN_ABR", "32"))  # kbps; below this speech quality suffers
+ARCHIVE_FULL_VIDEO = os.getenv("ARCHIVE_FULL_VIDEO", "true").lower() == "true"
+ARCHIVE_CONCURRENCY = int(os.getenv("ARCHIVE_CONCURRENCY", "1"))
+
+# Keyframes are pulled straight from the resolved video URL with seeks, so they
+# work in audio acquisition mode too; the whole extraction is time-boxed
+KEYFRAMES_ENABLED = os.getenv("KEYFRAMES_ENABLED", "true").lower() == "true"
+KEYFRAME_MAX_FRAMES = int(os.getenv("KEYFRAME_MAX_FRAMES", "12"))
+KEYFRAME_SCENE_THRESHOLD = float(os.getenv("KEYFRAME_SCENE_THRESHOLD", "0.3"))
+KEYFRAME_WIDTH = int(os.getenv("KEYFRAME_WIDTH", "480"))
+KEYFRAME_TIMEOUT_SECONDS = float(os.getenv("KEYFRAME_TIMEOUT_SECONDS", "90"))
+KEYFRAME_SCAN_SECONDS = float(os.getenv("KEYFRAME_SCAN_SECONDS", "1800"))
+
+# Durable job queue + worker pool (replaces unbounded BackgroundTasks)
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", str(Path(__file__).parent / "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "500"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+# Finished jobs and batches are deleted from the queue database after this long (0 keeps them);
+# results themselves live in MongoDB
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "168"))
+
+# Completed analyses younger than this are served from MongoDB; 0 disables the cache
+RESULT_CACHE_TTL_HOURS = float(os.getenv("RESULT_CACHE_TTL_HOURS", "24"))
+
+# Per-stage concurrency limits shared by all workers in this process
+STAGE_LIMITS = {
+    "download": int(os.getenv("DOWNLOAD_CONCURRENCY", "4")),
+    "stt": int(os.getenv("STT_CONCURRENCY", "2")),
+    "llm": int(os.getenv("LLM_CONCURRENCY", "2")),
+    "browser": int(os.getenv("BROWSER_CONCURRENCY", "2")),
+    "keyframes": int(os.getenv("KEYFRAME_CONCURRENCY", "1")),
+}
+
+# Max jobs per platform running at once across all workers, e.g. "instagram=1,twitter=2".
+# Keeps a large batch from hammering one site (and its login session) at full pool width.
+# Jobs are queued under the canonical platform name, so X posts count against "twitter"
+PLATFORM_LIMITS = {
+    name.strip(): int(limit)
+    for name, limit in (
+        pair.split("=") for pair in os.getenv("PLATFORM_CONCURRENCY", "instagram=1,twitter=2,reddit=2").split(",") if "=" in pair
+    )
+}
+BATCH_QUEUE_MAX = int(os.getenv("BATCH_QUEUE_MAX", "20000"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+
+# Hot-tier task status cache; the SQLite job table is shared by all uvicorn workers
+TASK_STATE_MAX_ENTRIES = int(os.getenv("TASK_STATE_MAX_ENTRIES", "10000"))
+TASK_STATE_TTL_SECONDS = float(os.getenv("TASK_STATE_TTL_SECONDS", "5"))
+
+# Completed results from concurrent workers are written with one insert_many
+RESULT_FLUSH_SIZE = int(os.getenv("RESULT_FLUSH_SIZE", "50"))
+RESULT_FLUSH_SECONDS = float(os.getenv("RESULT_FLUSH_SECONDS", "0.5"))
+
+# Comma-separated platforms whose engines are built in the background at startup
+ENGINE_WARMUP = [p.strip() for p in os.getenv("ENGINE_WARMUP", "").split(",") if p.strip()]
+
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
 from minio import Minio 
-from yt_dlp import YoutubeDL
 
-# Import your scraper engines
-from scrapers.youtube import YouTubeScraperEngine
-from scrapers.instagram import InstagramScraperEngine
-from scrapers.twitter import TwitterScraperEngine
-from scrapers.reddit import RedditScraperEngine
+# Scraper engines are imported and constructed on first use (see engines.py)
+from engines import EngineRegistry, ALIASES as PLATFORM_ALIASES
+from job_queue import JobQueue, QueueFullError
+from task_state import TaskStateStore
+from ai_client import AIServiceClient, CircuitOpenError
+from keyframes import KeyframeExtractor
+import metrics
+
+# --- PIPELINE METRICS ---
+STAGE_SECONDS = metrics.Histogram("pipeline_stage_seconds", "Wall time per analysis stage (scrape = browser session)")
+STAGE_INFLIGHT = metrics.Gauge("pipeline_stage_inflight", "Analysis stages currently running")
+STAGE_FAILURES = metrics.Counter("pipeline_stage_failures_total", "Analysis stages that raised")
+TASKS_TOTAL = metrics.Counter("pipeline_tasks_total", "Finished analysis tasks by status")
+DOWNLOAD_BYTES = metrics.Counter("pipeline_download_bytes_total", "Media bytes downloaded from the platform")
+DOWNLOAD_RATE = metrics.Histogram(
+    "pipeline_download_bytes_per_second", "Download throughput per task",
+    buckets=(64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+)
+TRANSCRIBE_RATE = metrics.Histogram(
+    "pipeline_transcription_seconds_per_audio_minute", "Transcription wall time per minute of audio",
+    buckets=(1, 2, 5, 10, 20, 30, 60, 120)
+)
+QUEUE_DEPTH = metrics.Gauge("pipeline_queue_depth", "Jobs waiting in the durable queue")
+CIRCUIT_OPEN = metrics.Gauge("pipeline_ai_circuit_open", "1 while the circuit breaker for an AI backend is open")
 
 # [UnifiedSchema class remains unchanged from your snippet]
 class UnifiedSchema:
@@ -440,7 +549,11 @@ class UnifiedSchema:
         if analysis_data:
             unified_data["transcription"] = analysis_data.get("transcript")
             unified_data["summary"] = analysis_data.get("summary")
-            unified_data["analysis_results"] = {"sentiment": analysis_data.get("sentiment")}
+            unified_data["analysis_results"] = {
+                "sentiment": analysis_data.get("sentiment"),
+                "keywords": analysis_data.get("keywords") or []
+            }
+            unified_data["keyframes"] = analysis_data.get("keyframes") or []
         return unified_data
 
     @staticmethod
@@ -462,29 +575,56 @@ class UnifiedSchema:
 # ============================================================
 # INITIALIZATION
 # ============================================================
-app = FastAPI(title="Social Media Scraper API")
-
-youtube_scraper = YouTubeScraperEngine()
-instagram_scraper = InstagramScraperEngine()
-twitter_scraper = TwitterScraperEngine()
-reddit_scraper = RedditScraperEngine()
-
-try:
-    client = MongoClient(f"mongodb://{DB_STORAGE_IP}:27017/", serverSelectionTimeoutMS=5000)
-    db = client["social_media_analyzer"]
-    collection = db["scraped_data"]
-    logger.info("✅ MongoDB Connected")
-except Exception as e:
-    logger.error(f"⚠️ MongoDB Warning: {e}")
-
-try:
-    minio_client = Minio(f"{DB_STORAGE_IP}:9000", access_key="minioadmin", secret_key="minioadmin", secure=False)
-    bucket_name = "scraped-results"
-    if not minio_client.bucket_exists(bucket_name):
-        minio_client.make_bucket(bucket_name)
-    logger.info("✅ MinIO Connected")
-except Exception as e:
-    logger.error(f"⚠️ MinIO Warning: {e}")
+def connect_mongo():
+    global client, db, collection
+    try:
+        client = MongoClient(f"mongodb://{DB_STORAGE_IP}:27017/", serverSelectionTimeoutMS=5000)
+        db = client["social_media_analyzer"]
+        collection = db["scraped_data"]
+        collection.create_index([("canonical_id", 1), ("completed_at", -1)])
+        logger.info("✅ MongoDB Connected")
+    except Exception as e:
+        logger.error(f"⚠️ MongoDB Warning: {e}")
+
+def connect_minio():
+    global minio_client
+    try:
+        minio_client = Minio(f"{DB_STORAGE_IP}:9000", access_key="minioadmin", secret_key="minioadmin", secure=False)
+        if not minio_client.bucket_exists(bucket_name):
+            minio_client.make_bucket(bucket_name)
+        logger.info("✅ MinIO Connected")
+    except Exception as e:
+        logger.error(f"⚠️ MinIO Warning: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    # Mongo and MinIO are independent round-trips; neither should hold up the other
+    await asyncio.gather(
+        loop.run_in_executor(None, connect_mongo),
+        loop.run_in_executor(None, connect_minio),
+    )
+    if ENGINE_WARMUP:
+        # Not awaited: the API is ready before the engines are, first use just waits on the lock
+        loop.run_in_executor(None, engines.warm_up, ENGINE_WARMUP)
+    # Worker ids include the pid so leases stay distinct across uvicorn processes
+    workers = [asyncio.ensure_future(job_worker(f"worker-{os.getpid()}-{i}")) for i in range(JOB_WORKERS)]
+    logger.info(f"✅ Started {JOB_WORKERS} job workers (limits: {STAGE_LIMITS})")
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await result_writer.aclose()
+    await whisper_client.aclose()
+    await llm_client.aclose()
+
+app = FastAPI(title="Social Media Scraper API", lifespan=lifespan)
+
+engines = EngineRegistry()
+
+# Populated by connect_mongo() / connect_minio() when the app starts
+client = db = collection = minio_client = None
+bucket_name = "scraped-results"
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
@@ -492,143 +632,1081 @@ class ScrapeRequest(BaseModel):
     url: str
     platform: str 
 
-task_memory = {}
+job_queue = JobQueue(
+    JOB_DB_PATH, max_pending=JOB_QUEUE_MAX, lease_seconds=JOB_LEASE_SECONDS, max_batch_pending=BATCH_QUEUE_MAX,
+    retention_seconds=JOB_RETENTION_HOURS * 3600
+)
+
+def load_task_state(task_id: str):
+    job = job_queue.get(task_id)
+    if not job:
+        return None
+    return {key: job[key] for key in ("task_id", "platform", "status", "stage", "error", "attempts")}
+
+task_states = TaskStateStore(load_task_state, max_entries=TASK_STATE_MAX_ENTRIES, ttl=TASK_STATE_TTL_SECONDS)
+stage_slots = {stage: asyncio.Semaphore(limit) for stage, limit in STAGE_LIMITS.items()}
+keyframe_extractor = KeyframeExtractor(
+    KEYFRAME_MAX_FRAMES, KEYFRAME_SCENE_THRESHOLD, KEYFRAME_WIDTH, KEYFRAME_TIMEOUT_SECONDS, KEYFRAME_SCAN_SECONDS
+)
+
+# The CPU STT box may take 20 minutes (1200s) on a long video
+whisper_client = AIServiceClient(
+    "whisper", max_connections=AI_MAX_CONNECTIONS, read_timeout=1200, connect_timeout=15,
+    retries=AI_RETRIES, failure_threshold=AI_BREAKER_THRESHOLD, reset_timeout=AI_BREAKER_RESET_SECONDS
+)
+llm_client = AIServiceClient(
+    "llm", max_connections=AI_MAX_CONNECTIONS, read_timeout=600,
+    retries=AI_RETRIES, failure_threshold=AI_BREAKER_THRESHOLD, reset_timeout=AI_BREAKER_RESET_SECONDS
+)
+
+# ============================================================
+# REQUEST COALESCING
+# ============================================================
+def normalize_platform(platform: str) -> str:
+    """One name per platform ("x" is "twitter"), so queue rows, limits and cache keys agree."""
+    platform = platform.lower()
+    return PLATFORM_ALIASES.get(platform, platform)
+
+def canonical_video_id(url: str, platform: str) -> str:
+    """Maps every URL form of the same video/post to one '<platform>:<id>' key."""
+    platform = normalize_platform(platform)
+    # Plain URL patterns, so canonicalising never has to build a scraper engine
+    patterns = {
+        "youtube": r'(?:youtu\.be/|[?&]v=|/embed/|/shorts/)([\w-]+)',
+        "twitter": r'/status/(\d+)',
+        "instagram": r'/(?:p|reels?)/([\w-]+)',
+        "reddit": r'/comments/(\w+)',
+    }
+    match = re.search(patterns[platform], url) if platform in patterns else None
+    video_id = match.group(1) if match else None
+    return f"{platform}:{video_id or url.split('?')[0].rstrip('/')}"
+
+def find_cached_result(canonical_id: str):
+    if RESULT_CACHE_TTL_HOURS <= 0:
+        return None
+    cutoff = datetime.utcnow() - timedelta(hours=RESULT_CACHE_TTL_HOURS)
+    return collection.find_one(
+        {"canonical_id": canonical_id, "status": "completed", "completed_at": {"$gte": cutoff}},
+        sort=[("completed_at", -1)]
+    )
+
+def find_cached_task_ids(canonical_ids: list) -> dict:
+    """Bulk version of find_cached_result: {canonical_id: task_id} in one query."""
+    if RESULT_CACHE_TTL_HOURS <= 0 or not canonical_ids:
+        return {}
+    cutoff = datetime.utcnow() - timedelta(hours=RESULT_CACHE_TTL_HOURS)
+    cursor = collection.find(
+        {"canonical_id": {"$in": list(set(canonical_ids))}, "status": "completed", "completed_at": {"$gte": cutoff}},
+        {"canonical_id": 1, "task_id": 1}
+    ).sort("completed_at", 1)
+    # Ascending sort, so the newest result for each canonical_id wins
+    return {doc["canonical_id"]: doc["task_id"] for doc in cursor}
+
+# ============================================================
+# BATCH INGESTION
+# ============================================================
+PLATFORM_HOSTS = {
+    "youtube.com": "youtube", "youtu.be": "youtube",
+    "instagram.com": "instagram",
+    "twitter.com": "twitter", "x.com": "twitter",
+    "reddit.com": "reddit", "redd.it": "reddit",
+}
+
+def detect_platform(url: str):
+    host = re.sub(r'^https?://', '', url.strip()).split("/")[0].split(":")[0].lower()
+    for domain, platform in PLATFORM_HOSTS.items():
+        if host == domain or host.endswith("." + domain):
+            return platform
+    return None
+
+def parse_ndjson(raw: bytes) -> list:
+    return [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+
+async def read_batch_entries(request: Request) -> list:
+    """
+    Accepts a JSON list, {"items": [...]}, an NDJSON body, or an NDJSON file
+    uploaded as multipart field "file". Entries are URL strings or
+    {"url": ..., "platform": ...} objects.
+    """
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or not hasattr(upload, "read"):
+                raise HTTPException(status_code=400, detail="Multipart batches need an NDJSON 'file' field")
+            return parse_ndjson(await upload.read())
+        body = await request.body()
+        if "ndjson" in content_type or "jsonl" in content_type:
+            return parse_ndjson(body)
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed batch: {e}")
+    entries = payload.get("items") if isinstance(payload, dict) else payload
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="Batch must be a list of URLs or {url, platform} objects")
+    return entries
+
+def normalize_batch_entries(entries: list):
+    """Returns (items, rejected); items carry url, platform and canonical_id."""
+    items, rejected = [], []
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        url = entry.get("url") if isinstance(entry, dict) else None
+        if not isinstance(url, str) or not url.strip():
+            rejected.append({"index": index, "error": "missing url"})
+            continue
+        url = url.strip()
+        platform = entry.get("platform") or detect_platform(url) or ""
+        if not isinstance(platform, str):
+            rejected.append({"index": index, "url": url, "error": "platform must be a string"})
+            continue
+        platform = normalize_platform(platform)
+        if not platform:
+            rejected.append({"index": index, "url": url, "error": "unknown platform"})
+            continue
+        items.append({"url": url, "platform": platform, "canonical_id": canonical_video_id(url, platform)})
+    return items, rejected
+
+# ============================================================
+# BULK PERSISTENCE
+# ============================================================
+class ResultWriter:
+    """
+    Collects finished results from all workers and writes them with
+    insert_many(ordered=False): a flush happens once `max_batch` documents
+    are waiting or `max_delay` seconds after the first one arrived.
+    insert() returns only after the document's own write succeeded, so a job
+    is never marked completed before its result is stored.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+        self._writes = set()
+
+    async def insert(self, doc: dict):
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((doc, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(self.max_delay, self._flush)
+        await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        write = asyncio.ensure_future(self._write(batch))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: list):
+        loop = asyncio.get_event_loop()
+        docs = [doc for doc, _ in batch]
+        failed = {}
+        try:
+            await loop.run_in_executor(None, lambda: collection.insert_many(docs, ordered=False))
+        except BulkWriteError as e:
+            # Unordered: everything except the reported documents was written
+            failed = {err["index"]: Exception(err.get("errmsg", "write failed")) for err in e.details["writeErrors"]}
+        except Exception as e:
+            failed = {index: e for index in range(len(batch))}
+        logger.info(f"💾 Stored {len(batch) - len(failed)}/{len(batch)} results in one bulk write")
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in failed:
+                future.set_exception(failed[index])
+            else:
+                future.set_result(None)
+
+    async def aclose(self):
+        self._flush()
+        await asyncio.gather(*self._writes, return_exceptions=True)
+
+result_writer = ResultWriter(RESULT_FLUSH_SIZE, RESULT_FLUSH_SECONDS)
 
 # ============================================================
 # WORKERS
 # ============================================================
-def download_video_to_memory(url: str, task_id: str):
-    logger.info(f"[{task_id}] STEP 1: Downloading video...")
-    ydl_opts = {'format': 'best[ext=mp4]/best', 'quiet': True}
+def resolve_media(url: str) -> dict:
+    # yt_dlp takes most of a second to import; only pay for it once a job runs
+    from yt_dlp import YoutubeDL
+    with YoutubeDL({'format': VIDEO_FORMAT, 'quiet': True}) as ydl:
+        return ydl.extract_info(url, download=False)
+
+def select_audio_format(info: dict):
+    """
+    Picks the lowest-bitrate audio-only format at or above AUDIO_MIN_ABR kbps.
+    Whisper resamples everything to 16 kHz mono, so higher bitrates are wasted bytes.
+    """
+    audio_formats = [
+        f for f in info.get("formats") or []
+        if f.get("url") and f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")
+        # Manifest-based formats (HLS/DASH) cannot be fetched with a single GET
+        and f.get("protocol", "https") in ("http", "https")
+    ]
+    if not audio_formats:
+        return None
+    bitrate = lambda f: f.get("abr") or f.get("tbr") or 0
+    usable = [f for f in audio_formats if bitrate(f) >= AUDIO_MIN_ABR] or audio_formats
+    return min(usable, key=lambda f: bitrate(f) or float("inf"))
+
+def record_download(total_bytes: int, started: float):
+    DOWNLOAD_BYTES.inc(total_bytes)
+    elapsed = time.perf_counter() - started
+    if elapsed > 0:
+        DOWNLOAD_RATE.observe(total_bytes / elapsed)
+
+def download_video_to_memory(stream_url: str, task_id: str):
+    logger.info(f"[{task_id}] STEP 1: Downloading media...")
+    started = time.perf_counter()
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            res = requests.get(info.get('url'), stream=True, timeout=60)
-            buffer = io.BytesIO()
-            for chunk in res.iter_content(chunk_size=1024*1024):
-                if chunk: buffer.write(chunk)
-            buffer.seek(0)
-            return buffer
+        res = requests.get(stream_url, stream=True, timeout=60)
+        buffer = io.BytesIO()
+        for chunk in res.iter_content(chunk_size=VIDEO_CHUNK_SIZE):
+            if chunk: buffer.write(chunk)
+        record_download(buffer.tell(), started)
+        buffer.seek(0)
+        return buffer
     except Exception as e:
         logger.error(f"[{task_id}] Download Error: {e}")
         return None
 
-def call_transcribe_from_memory(video_buffer: io.BytesIO, task_id: str):
-    logger.info(f"[{task_id}] STEP 2: Transcribing on CPU (This may take several minutes)...")
-    
-    # Configure retries for unstable CPU processing
-    session = requests.Session()
-    retries = Retry(total=2, backoff_factor=1, status_forcelist=[502, 503, 504])
-    session.mount('http://', HTTPAdapter(max_retries=retries))
-
+class ChunkReader:
+    """
+    Blocking file-like reader over a bounded queue of download chunks.
+    Each consumer gets its own reader; the producer blocks once `max_chunks`
+    are waiting, so memory per task stays at a few chunks regardless of video size.
+    """
+    _EOF = object()
+    _CLOSED = object()
+
+    def __init__(self, max_chunks: int):
+        self.queue = queue.Queue(maxsize=max_chunks)
+        self.closed = False
+        self._buffer = bytearray()
+        self._eof = False
+        self._error = None
+
+    # --- producer side ---
+    def put(self, item):
+        # Re-check `closed` periodically so a detached consumer never blocks the producer
+        while not self.closed:
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self):
+        self.put(self._EOF)
+
+    def fail(self, error: Exception):
+        self.put(error)
+
+    # --- consumer side ---
+    def _next_chunk(self) -> bytes:
+        if self._error:
+            raise self._error
+        if self.closed:
+            raise IOError("Chunk stream was closed")
+        item = self.queue.get()
+        if item is self._CLOSED:
+            raise IOError("Chunk stream was closed")
+        if item is self._EOF:
+            self._eof = True
+            return b""
+        if isinstance(item, Exception):
+            self._error = IOError(f"Upstream download failed: {item}")
+            raise self._error
+        return item
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._buffer += self._next_chunk()
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        """Detach the consumer: the producer skips this reader and pending reads fail."""
+        self.closed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        # Wake a consumer that is blocked waiting for the next chunk
+        try:
+            self.queue.put_nowait(self._CLOSED)
+        except queue.Full:
+            pass
+
+def stream_video_to_consumers(stream_url: str, task_id: str, readers: list) -> int:
+    logger.info(f"[{task_id}] STEP 1: Streaming media to storage and transcription...")
+    started = time.perf_counter()
+    total_bytes = 0
     try:
-        video_buffer.seek(0)
-        files = {'file': (f"video_{task_id}.mp4", video_buffer, 'video/mp4')}
-        
-        # INCREASED TIMEOUT: (Connect timeout, Read timeout)
-        # We give the CPU up to 20 minutes (1200s) to finish a long video
-        response = session.post(
-            WHISPER_API_URL, 
-            files=files, 
-            timeout=(15, 1200) 
-        )
-        
-        if response.status_code == 200:
-            logger.info(f"[{task_id}] Transcription Successful.")
-            return response.json()
-        else:
-            logger.error(f"[{task_id}] Whisper Server returned error {response.status_code}: {response.text}")
-            return None
-            
-    except requests.exceptions.Timeout:
-        logger.error(f"[{task_id}] CRITICAL: Whisper timed out. CPU is too slow or video is too long.")
+        res = requests.get(stream_url, stream=True, timeout=60)
+        res.raise_for_status()
+        for chunk in res.iter_content(chunk_size=VIDEO_CHUNK_SIZE):
+            if not chunk: continue
+            live_readers = [reader for reader in readers if not reader.closed]
+            if not live_readers:
+                raise Exception("All stream consumers detached.")
+            for reader in live_readers:
+                reader.put(chunk)
+            total_bytes += len(chunk)
+        for reader in readers:
+            reader.finish()
+        record_download(total_bytes, started)
+        logger.info(f"[{task_id}] Download finished ({total_bytes} bytes streamed).")
+        return total_bytes
     except Exception as e:
-        logger.error(f"[{task_id}] Transcription Exception: {e}")
+        logger.error(f"[{task_id}] Download Error: {e}")
+        for reader in readers:
+            reader.fail(e)
+        raise
+
+class ServiceSaturated(Exception):
+    """A backend answered 429; `retry_after` is how long it asked callers to wait."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"saturated, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+def retry_after_seconds(response: httpx.Response) -> float:
+    # Capped so a misbehaving backend cannot park a task for long
+    try:
+        return min(float(response.headers.get("Retry-After") or 1), 60.0)
+    except ValueError:
+        return 1.0
+
+def transcription_result(response: httpx.Response, task_id: str):
+    if response.status_code == 200:
+        logger.info(f"[{task_id}] Transcription Successful.")
+        return response.json()
+    logger.error(f"[{task_id}] Whisper Server returned error {response.status_code}: {response.text}")
+    return None
+
+async def iter_sse(response: httpx.Response):
+    """Yields (event, data) from a Server-Sent Events body; data is decoded JSON."""
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+        elif not line and data:
+            yield event, json.loads("\n".join(data))
+            event, data = "message", []
+
+async def read_transcription_events(task_id: str, on_segment, request: dict):
+    async with whisper_client.stream("POST", WHISPER_STREAM_API_URL, **request) as response:
+        if response.status_code == 429:
+            raise ServiceSaturated(retry_after_seconds(response))
+        if response.status_code != 200:
+            await response.aread()
+            return transcription_result(response, task_id)
+        async for event, data in iter_sse(response):
+            if event == "segment":
+                on_segment(data)
+            elif event == "done":
+                logger.info(f"[{task_id}] Transcription Successful ({len(data.get('segments', []))} segments streamed).")
+                return data
+            elif event == "error":
+                logger.error(f"[{task_id}] Whisper stream failed: {data.get('detail')}")
+                return None
+    logger.error(f"[{task_id}] Whisper stream ended without a result")
     return None
 
+async def send_transcription(task_id: str, on_segment, replayable: bool, request: dict):
+    if on_segment is not None:
+        return await read_transcription_events(task_id, on_segment, request)
+    if replayable:
+        # Retries for unstable CPU processing happen inside the shared client
+        response = await whisper_client.post_files(WHISPER_API_URL, **request)
+    else:
+        response = await whisper_client.post_stream(WHISPER_API_URL, **request)
+    if response.status_code == 429:
+        raise ServiceSaturated(retry_after_seconds(response))
+    return transcription_result(response, task_id)
+
+async def request_transcription(task_id: str, on_segment=None, replayable: bool = True, **request):
+    """
+    Sends one transcription request. With `on_segment`, the SSE endpoint is used and
+    each segment is reported as soon as Whisper finishes it. A buffered upload that
+    Whisper sheds with 429 is resent after its Retry-After, up to AI_RETRIES times;
+    a streamed body cannot be replayed.
+    """
+    for attempt in range(AI_RETRIES + 1):
+        try:
+            return await send_transcription(task_id, on_segment, replayable, request)
+        except ServiceSaturated as e:
+            if not replayable or attempt >= AI_RETRIES:
+                logger.error(f"[{task_id}] Whisper is saturated, giving up after {attempt + 1} attempt(s)")
+                return None
+            logger.warning(f"[{task_id}] Whisper is saturated, retrying in {e.retry_after:.0f}s...")
+            await asyncio.sleep(e.retry_after)
+        except CircuitOpenError:
+            raise
+        except httpx.TimeoutException:
+            logger.error(f"[{task_id}] CRITICAL: Whisper timed out. CPU is too slow or video is too long.")
+            return None
+        except Exception as e:
+            logger.error(f"[{task_id}] Transcription Exception: {e}")
+            return None
+
+async def call_transcribe_from_memory(video_buffer: io.BytesIO, task_id: str, filename: str = None, content_type: str = "video/mp4", on_segment=None):
+    logger.info(f"[{task_id}] STEP 2: Transcribing on CPU (This may take several minutes)...")
+    files = {'file': (filename or f"video_{task_id}.mp4", video_buffer, content_type)}
+    return await request_transcription(task_id, on_segment, files=files)
+
+async def iter_reader_async(reader: ChunkReader):
+    # ChunkReader blocks, so each read runs in the executor
+    loop = asyncio.get_event_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, reader.read, VIDEO_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+async def multipart_file_stream(chunks, boundary: str, filename: str, content_type: str):
+    # httpx cannot stream `files=`, so the form body is framed by hand and
+    # sent with chunked transfer encoding
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    async for chunk in chunks:
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+async def call_transcribe_from_stream(reader: ChunkReader, task_id: str, filename: str = None, content_type: str = "video/mp4", on_segment=None):
+    logger.info(f"[{task_id}] STEP 2: Transcribing on CPU while the download streams in...")
+    boundary = uuid.uuid4().hex
+    return await request_transcription(
+        task_id, on_segment, replayable=False,
+        content=multipart_file_stream(iter_reader_async(reader), boundary, filename or f"video_{task_id}.mp4", content_type),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+
+async def call_ai_service(url: str, payload: dict, task_id: str, service_name: str):
+    for attempt in range(AI_RETRIES + 1):
+        response = await llm_client.post_json(url, payload)
+        # 429 means the LLM queue is full: wait as told instead of failing the task
+        if response.status_code != 429 or attempt >= AI_RETRIES:
+            break
+        retry_after = retry_after_seconds(response)
+        logger.warning(f"[{task_id}] {service_name} is saturated, retrying in {retry_after:.0f}s...")
+        await asyncio.sleep(retry_after)
+    if response.status_code != 200:
+        logger.error(f"[{task_id}] {service_name} returned error {response.status_code}: {response.text}")
+        raise Exception(f"{service_name} failed with HTTP {response.status_code}")
+    return response.json()
+
+def upload_video_to_minio(video_bytes: bytes, task_id: str) -> str:
+    minio_path = f"{task_id}/{task_id}.mp4"
+    minio_client.put_object(bucket_name, minio_path, io.BytesIO(video_bytes), len(video_bytes), "video/mp4")
+    return minio_path
+
+def upload_stream_to_minio(reader: ChunkReader, task_id: str) -> str:
+    minio_path = f"{task_id}/{task_id}.mp4"
+    # Unknown length -> multipart upload; one part in flight keeps memory bounded
+    minio_client.put_object(
+        bucket_name, minio_path, reader, -1, "video/mp4",
+        part_size=MINIO_PART_SIZE, num_parallel_uploads=1
+    )
+    return minio_path
+
+def archive_video_to_minio(video_url: str, task_id: str, headers: dict = None) -> str:
+    minio_path = f"{task_id}/{task_id}.mp4"
+    res = requests.get(video_url, headers=headers, stream=True, timeout=60)
+    res.raise_for_status()
+    res.raw.decode_content = True
+    minio_client.put_object(
+        bucket_name, minio_path, res.raw, -1, "video/mp4",
+        part_size=MINIO_PART_SIZE, num_parallel_uploads=1
+    )
+    return minio_path
+
+def store_keyframes(video_url: str, duration, headers: dict, task_id: str) -> list:
+    """Extracts keyframes and uploads them under {task_id}/keyframes/; returns their timestamps and paths."""
+    frames = keyframe_extractor.extract(video_url, duration, headers)
+    stored = []
+    for index, frame in enumerate(frames):
+        minio_path = f"{task_id}/keyframes/{index:03d}_{int(frame['timestamp'] * 1000)}.jpg"
+        minio_client.put_object(bucket_name, minio_path, io.BytesIO(frame["image"]), len(frame["image"]), "image/jpeg")
+        stored.append({"timestamp": frame["timestamp"], "source": frame["source"], "minio_path": minio_path})
+    logger.info(f"[{task_id}] ✅ Stored {len(stored)} keyframes")
+    return stored
+
 # ============================================================
-# CORE SEQUENTIAL FLOW
+# EARLY ANALYSIS
 # ============================================================
-async def run_analysis(task_id: str, url: str, platform: str):
-    try:
-        task_memory[task_id] = {"status": "running", "platform": platform}
-        loop = asyncio.get_event_loop()
-        
-        # 1. DOWNLOAD
-        video_buffer = await loop.run_in_executor(None, download_video_to_memory, url, task_id)
-        if not video_buffer:
-            raise Exception("Download failed.")
+class EarlyAnalysis:
+    """
+    Starts the LLM analysis while the transcript is still streaming in.
+
+    Segments arrive in completion order; contiguous text from the start is cut
+    into chunks of about `chunk_chars` and each chunk is analyzed as soon as it
+    exists. When transcription ends the chunk summaries are analyzed once more
+    for the final summary and keywords, and chunk sentiments are combined by a
+    length-weighted vote. Transcripts shorter than one chunk never start early
+    work, so the normal single-pass call is used for them.
+    """
+
+    def __init__(self, analyze, chunk_chars: int):
+        self.analyze = analyze
+        self.chunk_chars = chunk_chars
+        self.chunks = []
+        self._texts = {}
+        self._next_index = 0
+        self._buffer = []
+        self._buffered = 0
+
+    def add(self, segment: dict):
+        self._texts[segment["index"]] = segment.get("text", "")
+        while self._next_index in self._texts:
+            text = self._texts.pop(self._next_index)
+            self._next_index += 1
+            if text:
+                self._buffer.append(text)
+                self._buffered += len(text) + 1
+            if self._buffered >= self.chunk_chars:
+                self._start_chunk()
+
+    def finish(self):
+        # The tail only needs its own pass when earlier chunks were already sent
+        if self.chunks and self._buffer:
+            self._start_chunk()
+
+    def _start_chunk(self):
+        text = " ".join(self._buffer)
+        self._buffer, self._buffered = [], 0
+        self.chunks.append((len(text), asyncio.ensure_future(self.analyze(text))))
+
+    async def result(self):
+        if not self.chunks:
+            return None
+        results = [res.get("result") or {} for res in await asyncio.gather(*(future for _, future in self.chunks))]
+        if len(results) == 1:
+            return results[0]
+        merged = (await self.analyze("\n".join(res.get("summary", "") for res in results))).get("result") or {}
+        votes = {}
+        for (length, _), res in zip(self.chunks, results):
+            if res.get("sentiment"):
+                votes[res["sentiment"]] = votes.get(res["sentiment"], 0) + length
+        if votes:
+            merged["sentiment"] = max(votes, key=votes.get)
+        return merged
+
+    def cancel(self):
+        for _, future in self.chunks:
+            future.cancel()
 
-        # 2. TRANSCRIBE (WAIT HERE)
-        trans_res = await loop.run_in_executor(None, call_transcribe_from_memory, video_buffer, task_id)
-        
-        # Flexibility check: Whisper sometimes returns 'text' instead of 'transcript'
-        transcript_text = None
-        if trans_res:
-            transcript_text = trans_res.get("transcription") or trans_res.get("text")
-
-        if not transcript_text:
-            logger.error(f"[{task_id}] Transcription succeeded but returned no text content.")
-            raise Exception("Step 2 Failed: Transcription result was empty.")
-        
-        logger.info(f"[{task_id}] ✅ Transcription Verified. Proceeding to Storage.")
-
-        # 3. UPLOAD TO MINIO (Only after transcription success)
-        logger.info(f"[{task_id}] STEP 3: Uploading to MinIO...")
-        minio_path = f"{task_id}/{task_id}.mp4"
-        video_buffer.seek(0)
-        minio_client.put_object(bucket_name, minio_path, video_buffer, len(video_buffer.getvalue()), "video/mp4")
-
-        # 4. SCRAPE DATA (Only after upload)
-        logger.info(f"[{task_id}] STEP 4: Starting Scraper for {platform}")
-        s_engine = {"youtube": youtube_scraper, "instagram": instagram_scraper, 
-                    "twitter": twitter_scraper, "x": twitter_scraper}.get(platform, reddit_scraper)
-        
-        scraper_data = await loop.run_in_executor(None, s_engine.scrape_real_data, url, task_id)
-        if not scraper_data:
-            raise Exception("Scraping engine returned no data.")
+# ============================================================
+# STAGE GRAPH
+# ============================================================
+async def run_stage_graph(stages: dict, task_id: str) -> dict:
+    """
+    Runs {name: (dependencies, coroutine_fn)} as a DAG. Every stage starts as soon
+    as its dependencies finish and receives their results as positional args,
+    so the task takes as long as its critical path instead of the sum of stages.
+    """
+    futures = {}
+
+    async def run_stage(name):
+        deps, fn = stages[name]
+        inputs = [await futures[dep] for dep in deps]
+        return await fn(*inputs)
+
+    for name in stages:
+        futures[name] = asyncio.ensure_future(run_stage(name))
 
-        # 5. LLM ANALYSIS
-        logger.info(f"[{task_id}] STEP 5: Running LLM Analysis...")
-        summary_res = requests.post(SUMMARY_API_URL, json={"text": transcript_text}).json()
-        sentiment_res = requests.post(SENTIMENT_API_URL, json={"text": transcript_text}).json()
+    try:
+        await asyncio.gather(*futures.values())
+    except Exception:
+        logger.error(f"[{task_id}] Stage failed, cancelling remaining stages.")
+        for future in futures.values():
+            future.cancel()
+        await asyncio.gather(*futures.values(), return_exceptions=True)
+        raise
+    return {name: future.result() for name, future in futures.items()}
 
-        # 6. FINAL CONSOLIDATION & SAVE
+# ============================================================
+# CORE ANALYSIS FLOW
+# ============================================================
+async def run_analysis(task_id: str, url: str, platform: str, canonical_id: str = None, worker_id: str = None):
+    stream_readers = []
+    early = None
+    loop = asyncio.get_event_loop()
+    try:
+        task_states.set(task_id, status="running", platform=platform)
+
+        @asynccontextmanager
+        async def track_stage(stage):
+            await loop.run_in_executor(None, job_queue.set_stage, task_id, stage)
+            task_states.set(task_id, stage=stage)
+            started = time.perf_counter()
+            STAGE_INFLIGHT.inc(stage=stage)
+            try:
+                yield
+            except asyncio.CancelledError:
+                # Cancelled because a sibling stage failed, the lease was lost or the app is stopping
+                raise
+            except BaseException:
+                STAGE_FAILURES.inc(stage=stage)
+                raise
+            finally:
+                STAGE_INFLIGHT.dec(stage=stage)
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+        async def blocking(stage, fn, *args):
+            async with track_stage(stage):
+                return await loop.run_in_executor(None, fn, *args)
+
+        # 1. RESOLVE FORMATS
+        media = {}
+
+        async def resolve():
+            info = await blocking("resolve", resolve_media, url)
+            media["video_url"] = info.get("url")
+            media["duration"] = info.get("duration")
+            media["http_headers"] = info.get("http_headers")
+            audio_format = select_audio_format(info) if ACQUISITION_MODE == "audio" else None
+            if audio_format:
+                # Transcription only needs the audio track; the video is archived after the analysis
+                ext = audio_format.get("ext") or "webm"
+                logger.info(f"[{task_id}] Using audio-only format {audio_format.get('format_id')} ({audio_format.get('abr')} kbps)")
+                media.update(source_url=audio_format["url"], audio_only=True,
+                             filename=f"audio_{task_id}.{ext}", content_type=f"audio/{ext}")
+            else:
+                media.update(source_url=media["video_url"], audio_only=False,
+                             filename=f"video_{task_id}.mp4", content_type="video/mp4")
+
+        # 2. DOWNLOAD
+        if STREAMING_MODE:
+            # Upload and transcription consume the download as it arrives
+            minio_reader = ChunkReader(STREAM_QUEUE_CHUNKS)
+            whisper_reader = ChunkReader(STREAM_QUEUE_CHUNKS)
+            stream_readers = [minio_reader, whisper_reader]
+            media_deps = ("resolve",)
+            stt_admitted = asyncio.Event()
+            media_admitted = asyncio.Event()
+
+            async def download(_):
+                # The download feeds the transcription directly, so it only starts once
+                # the transcription holds its STT slot; slots are always taken STT first
+                await stt_admitted.wait()
+                async with stage_slots["download"]:
+                    if media["audio_only"]:
+                        minio_reader.close()
+                    media_admitted.set()
+                    return await blocking("download", stream_video_to_consumers, media["source_url"], task_id, stream_readers)
+
+            @asynccontextmanager
+            async def media_slot(stage):
+                # The STT slot is held until transcription ends, not just the download;
+                # consumers only connect once their producer has been admitted
+                if stage == "transcribe":
+                    async with stage_slots["stt"]:
+                        stt_admitted.set()
+                        await media_admitted.wait()
+                        yield
+                else:
+                    await media_admitted.wait()
+                    yield
+
+            async def transcribe_video():
+                try:
+                    return await call_transcribe_from_stream(
+                        whisper_reader, task_id, media["filename"], media["content_type"],
+                        on_segment=early.add if early else None
+                    )
+                finally:
+                    whisper_reader.close()
+
+            def store_video():
+                return upload_stream_to_minio(minio_reader, task_id)
+        else:
+            media_deps = ("download",)
+
+            async def download(_):
+                async with stage_slots["download"]:
+                    video_buffer = await blocking("download", download_video_to_memory, media["source_url"], task_id)
+                if not video_buffer:
+                    raise Exception("Download failed.")
+                # Upload and transcription read concurrently, so each gets its own
+                # BytesIO view over the same immutable bytes instead of sharing a cursor
+                media["video_bytes"] = video_buffer.getvalue()
+
+            def media_slot(stage):
+                return stage_slots["stt"] if stage == "transcribe" else nullcontext()
+
+            async def transcribe_video():
+                return await call_transcribe_from_memory(
+                    io.BytesIO(media["video_bytes"]), task_id, media["filename"], media["content_type"],
+                    on_segment=early.add if early else None
+                )
+
+            def store_video():
+                return upload_video_to_minio(media["video_bytes"], task_id)
+
+        # 3. TRANSCRIBE (runs alongside the MinIO upload)
+        async def transcribe(*_):
+            async with media_slot("transcribe"):
+                started = time.perf_counter()
+                async with track_stage("transcribe"):
+                    trans_res = await transcribe_video()
+                if trans_res and media.get("duration"):
+                    TRANSCRIBE_RATE.observe((time.perf_counter() - started) / (media["duration"] / 60))
+            if early and trans_res:
+                early.finish()
+
+            # Flexibility check: Whisper sometimes returns 'text' instead of 'transcript'
+            transcript_text = None
+            if trans_res:
+                transcript_text = trans_res.get("transcription") or trans_res.get("text")
+
+            if not transcript_text:
+                logger.error(f"[{task_id}] Transcription succeeded but returned no text content.")
+                raise Exception("Step 2 Failed: Transcription result was empty.")
+
+            logger.info(f"[{task_id}] ✅ Transcription Verified.")
+            return transcript_text
+
+        # 4. UPLOAD TO MINIO
+        async def upload(*_):
+            async with media_slot("upload"):
+                if media["audio_only"]:
+                    return None
+                logger.info(f"[{task_id}] STEP 3: Uploading to MinIO...")
+                return await blocking("upload", store_video)
+
+        # 5. SCRAPE DATA (needs nothing from the media stages)
+        async def scrape():
+            logger.info(f"[{task_id}] STEP 4: Starting Scraper for {platform}")
+
+            async with stage_slots["browser"]:
+                # Engine construction can block too, so it happens on the worker thread
+                scraper_data = await blocking(
+                    "scrape", lambda: engines.get(platform).scrape_real_data(url, task_id)
+                )
+            if not scraper_data:
+                raise Exception("Scraping engine returned no data.")
+            return scraper_data
+
+        # 5b. KEYFRAMES (visual metadata is best-effort and never fails the task)
+        async def keyframes(_):
+            if not KEYFRAMES_ENABLED or not media.get("video_url"):
+                return []
+            try:
+                async with stage_slots["keyframes"]:
+                    return await blocking(
+                        "keyframes", store_keyframes,
+                        media["video_url"], media.get("duration"), media.get("http_headers"), task_id
+                    )
+            except Exception as e:
+                logger.warning(f"[{task_id}] Keyframe extraction skipped: {e}")
+                return []
+
+        # 6. LLM ANALYSIS (summary, sentiment and keywords in one pass over the transcript)
+        async def llm_analysis(text):
+            async with stage_slots["llm"]:
+                logger.info(f"[{task_id}] STEP 5: Running LLM Analysis...")
+                async with track_stage("analysis"):
+                    return await call_ai_service(ANALYZE_API_URL, {"text": text}, task_id, "Analysis")
+
+        if TRANSCRIBE_STREAMING:
+            early = EarlyAnalysis(llm_analysis, EARLY_ANALYSIS_CHARS)
+
+        # 6b. COMMENT SENTIMENT (best-effort; a failed chunk keeps the scraper's labels)
+        async def comment_sentiment(scraper_data):
+            comments = scraper_data.get("comments")
+            if isinstance(comments, dict):
+                comments = comments.get("data")
+            comments = [c for c in comments or [] if isinstance(c, dict) and c.get("text")]
+            if not COMMENT_SENTIMENT_LLM or not comments:
+                return 0
+            relabeled = 0
+            for start in range(0, len(comments), COMMENT_SENTIMENT_CHUNK):
+                chunk = comments[start:start + COMMENT_SENTIMENT_CHUNK]
+                try:
+                    # One slot and one read timeout per chunk, so a long thread shares the LLM fairly
+                    async with stage_slots["llm"]:
+                        async with track_stage("comment_sentiment"):
+                            res = await call_ai_service(
+                                SENTIMENT_BATCH_API_URL, {"texts": [c["text"] for c in chunk]}, task_id, "Comment sentiment"
+                            )
+                    labels = res.get("results") or []
+                    if len(labels) != len(chunk):
+                        raise ValueError(f"expected {len(chunk)} labels, got {len(labels)}")
+                except Exception as e:
+                    logger.warning(f"[{task_id}] Comment sentiment kept from scraper for comments {start}-{start + len(chunk) - 1}: {e}")
+                    continue
+                for comment, label in zip(chunk, labels):
+                    comment.update(sentiment=label, confidence=None, sentiment_source="llm")
+                relabeled += len(chunk)
+            return relabeled
+
+        async def analyze(transcript_text):
+            early_result = await early.result() if early else None
+            result = early_result or (await llm_analysis(transcript_text)).get("result") or {}
+            # An empty analysis must never be stored (and later served from cache) as completed
+            if not result.get("summary") or not result.get("sentiment"):
+                raise Exception("Step 5 Failed: LLM analysis returned no summary or sentiment.")
+            return result
+
+        results = await run_stage_graph({
+            "resolve": ((), resolve),
+            "download": (("resolve",), download),
+            "transcribe": (media_deps, transcribe),
+            "upload": (media_deps, upload),
+            "scrape": ((), scrape),
+            "keyframes": (("resolve",), keyframes),
+            "comment_sentiment": (("scrape",), comment_sentiment),
+            "analysis": (("transcribe",), analyze),
+        }, task_id)
+
+        # 7. FINAL CONSOLIDATION & SAVE
         logger.info(f"[{task_id}] STEP 6: Saving to MongoDB")
-        scraper_data["minio_video_path"] = minio_path
+        scraper_data = results["scrape"]
+        scraper_data["minio_video_path"] = results["upload"]
         analysis_payload = {
-            "transcript": transcript_text,
-            "summary": summary_res.get("summary"),
-            "sentiment": sentiment_res.get("sentiment")
+            "transcript": results["transcribe"],
+            "summary": results["analysis"].get("summary"),
+            "sentiment": results["analysis"].get("sentiment"),
+            "keywords": results["analysis"].get("keywords"),
+            "keyframes": results["keyframes"]
         }
         
         final_data = UnifiedSchema.transform(platform, scraper_data, analysis_payload)
-        final_data.update({"task_id": task_id, "status": "completed"})
+        final_data.update({
+            "task_id": task_id,
+            "status": "completed",
+            "canonical_id": canonical_id,
+            "completed_at": datetime.utcnow()
+        })
         
-        collection.insert_one(final_data)
-        task_memory[task_id] = final_data
+        await result_writer.insert(final_data)
+        if not await loop.run_in_executor(None, job_queue.finish, task_id, "completed", None, worker_id):
+            logger.warning(f"[{task_id}] {worker_id} finished after losing its lease")
+        task_states.set(task_id, status="completed", error=None)
+        TASKS_TOTAL.inc(status="completed")
         logger.info(f"🏁 [TASK {task_id}] COMPLETED SUCCESSFULLY")
+
+        if media["audio_only"] and ARCHIVE_FULL_VIDEO:
+            try:
+                await loop.run_in_executor(None, job_queue.enqueue_archive, task_id, url, platform)
+            except Exception as e:
+                logger.error(f"[{task_id}] Could not queue the video archive: {e}")
             
     except Exception as e:
         logger.error(f"❌ [TASK {task_id}] FAILED: {str(e)}")
-        task_memory[task_id] = {"status": "failed", "error": str(e)}
+        await loop.run_in_executor(None, job_queue.finish, task_id, "failed", str(e), worker_id)
+        task_states.set(task_id, status="failed", error=str(e))
+        TASKS_TOTAL.inc(status="failed")
+    finally:
+        if early:
+            early.cancel()
+        # Fails any half-finished multipart upload and stops the download
+        for reader in stream_readers:
+            reader.close()
+
+async def archive_full_video(archive_id: str, url: str, worker_id: str = None):
+    """
+    Runs a queued archive job: stores the full video of an analyzed task in MinIO.
+    At most ARCHIVE_CONCURRENCY of these are leased at once. The media URL is
+    resolved again here because signed URLs from the analysis may have expired
+    while the job waited.
+    """
+    loop = asyncio.get_event_loop()
+    task_id = archive_id.rsplit(":", 1)[0]
+    try:
+        logger.info(f"[{task_id}] Archiving full video to MinIO...")
+        info = await loop.run_in_executor(None, resolve_media, url)
+        minio_path = await loop.run_in_executor(
+            None, archive_video_to_minio, info.get("url"), task_id, info.get("http_headers")
+        )
+        await loop.run_in_executor(
+            None, collection.update_one, {"task_id": task_id}, {"$set": {"minio_video_path": minio_path}}
+        )
+        await loop.run_in_executor(None, job_queue.finish, archive_id, "completed", None, worker_id)
+        logger.info(f"[{task_id}] ✅ Video archived at {minio_path}")
+    except Exception as e:
+        logger.error(f"[{task_id}] Video archive failed: {e}")
+        await loop.run_in_executor(None, job_queue.finish, archive_id, "failed", str(e), worker_id)
+
+# ============================================================
+# JOB WORKERS
+# ============================================================
+async def renew_lease(task_id: str, worker_id: str, run: asyncio.Future):
+    """Extends the lease while `run` works on the job, and cancels it once another worker may own it."""
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            renewed = await loop.run_in_executor(None, job_queue.heartbeat, task_id, worker_id)
+        except Exception as e:
+            # A locked or busy database is retried on the next beat; the lease has slack for two misses
+            logger.error(f"[{task_id}] Lease heartbeat failed: {e}")
+            continue
+        if not renewed:
+            logger.warning(f"[{task_id}] {worker_id} lost its lease, abandoning the task")
+            run.cancel()
+            return
+
+async def job_worker(worker_id: str):
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            job = await loop.run_in_executor(None, job_queue.lease, worker_id, PLATFORM_LIMITS, ARCHIVE_CONCURRENCY)
+        except Exception as e:
+            logger.error(f"[{worker_id}] Could not lease a job: {e}")
+            job = None
+        if not job:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+
+        logger.info(f"[{job['task_id']}] Leased by {worker_id} (attempt {job['attempts'] + 1})")
+        if job["kind"] == "archive":
+            run = asyncio.ensure_future(archive_full_video(job["task_id"], job["url"], worker_id))
+        else:
+            run = asyncio.ensure_future(
+                run_analysis(job["task_id"], job["url"], job["platform"], job["canonical_id"], worker_id)
+            )
+        heartbeat = asyncio.ensure_future(renew_lease(job["task_id"], worker_id, run))
+        try:
+            await run
+        except asyncio.CancelledError:
+            # Cancelled by the heartbeat: the job belongs to another worker now, keep leasing
+            if not heartbeat.done() or heartbeat.cancelled():
+                raise
+        finally:
+            heartbeat.cancel()
 
 # ============================================================
 # API ENDPOINTS
 # ============================================================
 @app.post("/scrape")
-async def start_scraping(req: ScrapeRequest, background_tasks: BackgroundTasks):
-    task_id = str(uuid.uuid4())
-    background_tasks.add_task(run_analysis, task_id, req.url, req.platform.lower())
-    return {"task_id": task_id, "status": "started"}
+async def start_scraping(req: ScrapeRequest):
+    loop = asyncio.get_event_loop()
+    platform = normalize_platform(req.platform)
+    canonical_id = canonical_video_id(req.url, platform)
+
+    try:
+        cached = await loop.run_in_executor(None, find_cached_result, canonical_id)
+    except Exception as e:
+        # The cache is an optimisation: with MongoDB down the job is still queued
+        logger.warning(f"Cache lookup for {canonical_id} failed, treating as a miss: {e}")
+        cached = None
+    if cached:
+        logger.info(f"Cache HIT for {canonical_id} (task {cached['task_id']})")
+        cached["_id"] = str(cached["_id"])
+        cached["cached"] = True
+        return cached
+
+    try:
+        task_id, created = await loop.run_in_executor(
+            None, lambda: job_queue.enqueue(req.url, platform, canonical_id=canonical_id)
+        )
+    except QueueFullError as e:
+        # Backpressure: tell clients to come back instead of piling up downloads
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    if not created:
+        # Same video already queued or running: attach to that task
+        logger.info(f"Coalesced request for {canonical_id} onto task {task_id}")
+        return {"task_id": task_id, "status": "queued", "deduplicated": True}
+    return {"task_id": task_id, "status": "queued"}
+
+@app.post("/scrape/batch")
+async def start_batch(request: Request):
+    loop = asyncio.get_event_loop()
+    entries = await read_batch_entries(request)
+    if len(entries) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batches are limited to {BATCH_MAX_ITEMS} URLs")
+    items, rejected = normalize_batch_entries(entries)
+    if not items:
+        raise HTTPException(status_code=400, detail={"error": "No valid URLs in batch", "rejected": rejected})
+
+    try:
+        cached = await loop.run_in_executor(None, find_cached_task_ids, [item["canonical_id"] for item in items])
+    except Exception as e:
+        logger.warning(f"Batch cache lookup failed, queueing every item: {e}")
+        cached = {}
+    for item in items:
+        item["cached_task_id"] = cached.get(item["canonical_id"])
+
+    batch_id = str(uuid.uuid4())
+    try:
+        counts = await loop.run_in_executor(None, job_queue.enqueue_batch, batch_id, items)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "300"})
+
+    by_platform = {}
+    for item in items:
+        by_platform[item["platform"]] = by_platform.get(item["platform"], 0) + 1
+    logger.info(f"📦 Batch {batch_id}: {len(items)} URLs {counts}, {len(rejected)} rejected")
+    return {
+        "batch_id": batch_id, "total": len(items), **counts,
+        "by_platform": by_platform, "rejected": rejected
+    }
+
+@app.get("/scrape/batch/{batch_id}")
+async def get_batch(batch_id: str, include_tasks: bool = False):
+    loop = asyncio.get_event_loop()
+    progress = await loop.run_in_executor(None, job_queue.batch_progress, batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown batch")
+    counts = progress["counts"]
+    total = sum(counts.values())
+    finished = sum(counts.get(status, 0) for status in ("completed", "failed", "cached"))
+    response = {
+        "batch_id": batch_id, "total": total, "finished": finished,
+        "progress": round(finished / total, 4), "done": finished == total, **progress
+    }
+    if include_tasks:
+        response["tasks"] = await loop.run_in_executor(None, job_queue.batch_tasks, batch_id)
+    return response
 
 @app.get("/results/{task_id}")
 async def get_results(task_id: str):
-    res = task_memory.get(task_id) or collection.find_one({"task_id": task_id})
-    if not res: return {"status": "pending"}
+    loop = asyncio.get_event_loop()
+    state = await loop.run_in_executor(None, task_states.get, task_id)
+    if state and state["status"] != "completed":
+        return state
+    # Full results only ever live in MongoDB, so every worker process sees the same document
+    res = await loop.run_in_executor(None, collection.find_one, {"task_id": task_id})
+    if not res:
+        return state or {"status": "pending"}
     # Use a helper to make MongoDB object JSON serializable
     if "_id" in res: res["_id"] = str(res["_id"])
     return res
 
+@app.get("/health")
+async def health():
+    return {"status": "online", "engines": engines.loaded(), "cached_task_states": len(task_states)}
+
+@app.get("/metrics")
+async def get_metrics():
+    loop = asyncio.get_event_loop()
+    QUEUE_DEPTH.set(await loop.run_in_executor(None, job_queue.depth))
+    for ai_client in (whisper_client, llm_client):
+        CIRCUIT_OPEN.set(1 if ai_client.breaker.state == "open" else 0, backend=ai_client.name)
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
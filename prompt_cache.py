@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+
+
+class PromptCache:
+    """
+    Two-tier cache of LLM completions: an in-process LRU of `memory_entries` in
+    front of an optional DiskCache shared across restarts and workers.
+
+    Values are {"content", "tokens"}; `tokens` is what the backend spent on the
+    completion, so every hit adds it to `saved_tokens`. Disk hits are promoted
+    into memory.
+    """
+
+    def __init__(self, memory_entries: int, disk=None):
+        self.memory_entries = memory_entries
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_tokens = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, value: dict):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """Returns (value, tier) with tier "memory" or "disk", or (None, None) on a miss."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.saved_tokens += value.get("tokens", 0)
+                return value, "memory"
+        value = self.disk.get(key) if self.disk else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None, None
+            self._remember(key, value)
+            self.disk_hits += 1
+            self.saved_tokens += value.get("tokens", 0)
+        return value, "disk"
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._remember(key, value)
+        if self.disk:
+            self.disk.set(key, value)
+
+    def bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+            "disk": self.disk.stats() if self.disk else None,
+        }
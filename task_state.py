@@ -0,0 +1,60 @@
+import time
+import threading
+from collections import OrderedDict
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+class TaskStateStore:
+    """
+    Bounded in-process cache of lightweight task status in front of a shared store.
+
+    Only small status dicts (status, platform, stage, error...) live here, never
+    transcripts or scraped payloads; full results are read from MongoDB. Entries
+    are evicted least-recently-used beyond `max_entries`. Active tasks expire
+    after `ttl` seconds so a process re-reads state written by other uvicorn
+    workers; finished tasks no longer change and are kept for `terminal_ttl`.
+    `loader(task_id)` reads the shared store (the SQLite job table) on a miss.
+    """
+
+    def __init__(self, loader, max_entries: int = 10000, ttl: float = 5.0, terminal_ttl: float = 3600.0):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.terminal_ttl = terminal_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expires_at(self, state: dict) -> float:
+        ttl = self.terminal_ttl if state.get("status") in TERMINAL_STATUSES else self.ttl
+        return time.monotonic() + ttl
+
+    def _store(self, task_id: str, state: dict):
+        self._entries[task_id] = (state, self._expires_at(state))
+        self._entries.move_to_end(task_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, task_id: str, **fields):
+        """Merges `fields` into the cached state of a task running in this process."""
+        with self._lock:
+            entry = self._entries.get(task_id)
+            state = dict(entry[0]) if entry else {"task_id": task_id}
+            state.update(fields)
+            self._store(task_id, state)
+
+    def get(self, task_id: str):
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(task_id)
+                return dict(entry[0])
+        state = self.loader(task_id)
+        if state is None:
+            return None
+        with self._lock:
+            self._store(task_id, state)
+        return dict(state)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,24 @@
+from main import normalize_batch_entries
+
+
+def test_non_string_platform_is_rejected():
+    items, rejected = normalize_batch_entries([
+        {"url": "https://x.com/someone/status/1", "platform": 3},
+        {"url": "https://youtu.be/abc123", "platform": ["youtube"]},
+    ])
+    assert items == []
+    assert rejected == [
+        {"index": 0, "url": "https://x.com/someone/status/1", "error": "platform must be a string"},
+        {"index": 1, "url": "https://youtu.be/abc123", "error": "platform must be a string"},
+    ]
+
+
+def test_valid_entries_survive_a_bad_neighbour():
+    items, rejected = normalize_batch_entries([
+        {"url": "https://x.com/someone/status/1", "platform": 3},
+        "https://youtu.be/abc123",
+        {"url": "https://x.com/someone/status/2", "platform": "X"},
+    ])
+    assert [item["platform"] for item in items] == ["youtube", "twitter"]
+    assert items[1]["canonical_id"] == "twitter:2"
+    assert [entry["index"] for entry in rejected] == [0]
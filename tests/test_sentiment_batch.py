@@ -0,0 +1,45 @@
+import re
+import json
+import asyncio
+
+import llm_services
+
+
+def fake_token_count(text: str) -> int:
+    # Roughly BPE-like: words split into pieces of up to four letters, every other symbol is a token
+    return len(re.findall(r"[A-Za-z]{1,4}|\S", text))
+
+
+def run_full_chunk(monkeypatch, count_tokens):
+    budgets = []
+
+    async def fake_call_llm(prompt, tokens, task, options=None, validate=None):
+        budgets.append(tokens)
+        return json.dumps(["Negative"] * llm_services.SENTIMENT_BATCH_SIZE)
+
+    monkeypatch.setattr(llm_services, "label_token_cost", None)
+    monkeypatch.setattr(llm_services.llm_client, "count_tokens", count_tokens)
+    monkeypatch.setattr(llm_services.llm_client, "_call_llm", fake_call_llm)
+    texts = [f"comment number {i}" for i in range(llm_services.SENTIMENT_BATCH_SIZE)]
+    labels = asyncio.run(llm_services.classify_batch(texts))
+    assert labels == ["Negative"] * len(texts)
+    return budgets[0]
+
+
+def test_full_chunk_budget_fits_the_longest_labels(monkeypatch):
+    async def count_tokens(text):
+        return fake_token_count(text)
+
+    budget = run_full_chunk(monkeypatch, count_tokens)
+    longest = max(llm_services.SENTIMENT_LABELS, key=len)
+    needed = fake_token_count(json.dumps([longest] * llm_services.SENTIMENT_BATCH_SIZE))
+    assert budget >= needed
+
+
+def test_budget_without_tokenizer_covers_every_character(monkeypatch):
+    async def count_tokens(text):
+        return None
+
+    budget = run_full_chunk(monkeypatch, count_tokens)
+    longest = max(llm_services.SENTIMENT_LABELS, key=len)
+    assert budget >= len(json.dumps([longest] * llm_services.SENTIMENT_BATCH_SIZE))
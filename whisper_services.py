@@ -1,88 +1,742 @@
 import io
-import subprocess
-import requests
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import os
+import re
+import json
+import time
+import uuid
+import struct
+import hashlib
+import asyncio
+import tempfile
+import threading
+import httpx
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-app = FastAPI(title="Pro STT Service (16kHz Mono)")
+import metrics
+from admission import AdmissionGate, AdmissionRejected
+from disk_cache import DiskCache
+
+# Pooled keep-alive client for the STT backend, opened and closed with the app
+backend_client = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global backend_client
+    backend_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(STT_DEADLINE_SECONDS, connect=STT_CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(max_connections=STT_MAX_CONNECTIONS, max_keepalive_connections=STT_MAX_CONNECTIONS)
+    )
+    try:
+        yield
+    finally:
+        await backend_client.aclose()
+
+app = FastAPI(title="Pro STT Service (16kHz Mono)", lifespan=lifespan)
 
 # IMPORTANT: Ensure this matches your actual Whisper/STT backend IP and port
-STT_BACKEND_URL = "http://10.94.157.37:5000/whisper"
+STT_BACKEND_URL = os.getenv("STT_BACKEND_URL", "http://10.94.157.37:5000/whisper")
+# Budget for all backend calls of one request (segments and retries included);
+# past it the request fails with 504 and outstanding backend calls are cancelled
+STT_DEADLINE_SECONDS = float(os.getenv("STT_DEADLINE_SECONDS", "1200"))
+STT_CONNECT_TIMEOUT_SECONDS = float(os.getenv("STT_CONNECT_TIMEOUT_SECONDS", "10"))
+STT_MAX_CONNECTIONS = int(os.getenv("STT_MAX_CONNECTIONS", "32"))
+# How often a running /transcribe checks whether its caller is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1.0"))
+
+# 16kHz * mono * 16-bit PCM
+SAMPLE_RATE = 16000
+PCM_BYTES_PER_SECOND = 32000
+WAV_HEADER_SIZE = 44
+
+# Uploads are piped through ffmpeg in chunks; converted audio stays in RAM up to
+# SPOOL_MAX_MEMORY and spills to a temp file beyond that
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+SPOOL_MAX_MEMORY = int(os.getenv("SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+
+# ffmpeg competes with the STT backend for CPU: at most FFMPEG_CONCURRENCY conversions
+# run at once, FFMPEG_QUEUE_MAX more wait, and anything beyond that gets a 429
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", str(max(1, (os.cpu_count() or 2) // 2))))
+FFMPEG_QUEUE_MAX = int(os.getenv("FFMPEG_QUEUE_MAX", "16"))
+
+# Long audio is cut at silences (found by ffmpeg's silencedetect during conversion)
+# into segments of at most SEGMENT_MAX_SECONDS, transcribed SEGMENT_FANOUT at a time
+SILENCE_NOISE_DB = float(os.getenv("SILENCE_NOISE_DB", "-35"))
+SILENCE_MIN_SECONDS = float(os.getenv("SILENCE_MIN_SECONDS", "0.4"))
+SEGMENT_MAX_SECONDS = float(os.getenv("SEGMENT_MAX_SECONDS", "90"))
+SEGMENT_MIN_SECONDS = float(os.getenv("SEGMENT_MIN_SECONDS", "15"))
+SEGMENT_FANOUT = int(os.getenv("SEGMENT_FANOUT", "4"))
+SEGMENT_RETRIES = int(os.getenv("SEGMENT_RETRIES", "2"))
+
+# Format segments travel to the backend in: "flac" (lossless, ~half of WAV), "opus"
+# (OPUS_BITRATE, ~1/15 of WAV) or "wav". A segment rejected with 400/415 is resent
+# as WAV; after STT_FORMAT_MAX_REJECTIONS rejections in a row the whole process
+# sends WAV, and tries the compressed format again STT_FORMAT_RETRY_SECONDS later
+STT_TRANSPORT_FORMAT = os.getenv("STT_TRANSPORT_FORMAT", "flac").lower()
+STT_FORMAT_MAX_REJECTIONS = int(os.getenv("STT_FORMAT_MAX_REJECTIONS", "3"))
+STT_FORMAT_RETRY_SECONDS = float(os.getenv("STT_FORMAT_RETRY_SECONDS", "600"))
+OPUS_BITRATE = os.getenv("OPUS_BITRATE", "24k")
+# Uploads up to this size that are already 16kHz mono in the transport codec are sent as-is
+PASSTHROUGH_MAX_BYTES = int(os.getenv("PASSTHROUGH_MAX_BYTES", str(4 * 1024 * 1024)))
+
+# Optional voice-activity trimming: silences of at least VAD_MIN_SILENCE_SECONDS are
+# dropped before STT, keeping VAD_PAD_SECONDS on each side so word edges survive
+VAD_TRIM = os.getenv("VAD_TRIM", "false").lower() == "true"
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "1.0"))
+VAD_PAD_SECONDS = float(os.getenv("VAD_PAD_SECONDS", "0.25"))
+
+# Transcripts keyed by a hash of the normalized PCM; bump the version when the
+# backend model or segmentation changes so old transcripts are not served
+TRANSCRIPT_CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE_ENABLED", "true").lower() == "true"
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "transcripts"))
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+TRANSCRIPT_CACHE_VERSION = os.getenv("TRANSCRIPT_CACHE_VERSION", "1")
+
+REQUEST_SECONDS = metrics.Histogram("stt_request_seconds", "End-to-end /transcribe latency")
+FFMPEG_SECONDS = metrics.Histogram("stt_ffmpeg_seconds", "FFmpeg conversion time per request")
+BACKEND_SECONDS = metrics.Histogram("stt_backend_seconds", "Whisper backend time per request")
+SECONDS_PER_AUDIO_MINUTE = metrics.Histogram(
+    "stt_seconds_per_audio_minute", "Whisper backend time per minute of audio",
+    buckets=(1, 2, 5, 10, 20, 30, 60, 120)
+)
+AUDIO_SECONDS = metrics.Counter("stt_audio_seconds_total", "Seconds of audio sent to the backend")
+UPLOAD_BYTES = metrics.Counter("stt_upload_bytes_total", "Raw bytes received on /transcribe")
+INFLIGHT = metrics.Gauge("stt_inflight_requests", "Transcriptions currently being processed")
+SEGMENTS_TOTAL = metrics.Counter("stt_segments_total", "Audio segments sent to the backend")
+SEGMENT_RETRIES_TOTAL = metrics.Counter("stt_segment_retries_total", "Segment requests retried after a failure")
+REQUESTS_TOTAL = metrics.Counter("stt_requests_total", "Finished /transcribe requests by status")
+FFMPEG_QUEUE_SECONDS = metrics.Histogram("stt_ffmpeg_queue_seconds", "Time spent waiting for an ffmpeg slot")
+FFMPEG_ACTIVE = metrics.Gauge("stt_ffmpeg_active", "ffmpeg conversions running")
+FFMPEG_WAITING = metrics.Gauge("stt_ffmpeg_waiting", "Conversions queued for an ffmpeg slot")
+FFMPEG_REJECTED = metrics.Counter("stt_ffmpeg_rejected_total", "Uploads turned away with 429 because the queue was full")
+VAD_TRIMMED_SECONDS = metrics.Counter("stt_vad_trimmed_seconds_total", "Seconds of non-speech dropped before STT")
+FIRST_SEGMENT_SECONDS = metrics.Histogram("stt_first_segment_seconds", "Time from conversion to the first streamed segment")
+TRANSPORT_BYTES = metrics.Counter("stt_transport_bytes_total", "Audio bytes posted to the backend by format")
+TRANSPORT_DOWNGRADED = metrics.Gauge("stt_transport_downgraded", "1 while segments are sent as WAV because the backend rejected the configured format")
+PASSTHROUGH_TOTAL = metrics.Counter("stt_passthrough_total", "Uploads forwarded without re-encoding")
+CACHE_LOOKUPS = metrics.Counter("stt_transcript_cache_lookups_total", "Transcript cache lookups by result (hit | miss)")
+
+ffmpeg_gate = AdmissionGate("ffmpeg", FFMPEG_CONCURRENCY, FFMPEG_QUEUE_MAX)
+# format -> (codec as ffmpeg names it, content type, file extension, encoder args)
+TRANSPORT_CODECS = {
+    "wav": ("pcm_s16le", "audio/wav", "wav", None),
+    "flac": ("flac", "audio/flac", "flac", ['-c:a', 'flac', '-f', 'flac']),
+    "opus": ("opus", "audio/ogg", "ogg", ['-c:a', 'libopus', '-b:a', OPUS_BITRATE, '-application', 'voip', '-f', 'ogg']),
+}
+
+class TransportNegotiator:
+    """
+    Picks the format segments are posted in. One rejected segment only falls back
+    to WAV itself; `max_rejections` consecutive 400/415 answers switch everything
+    to WAV, and the preferred format is probed again after `retry_seconds` so a
+    backend upgrade (or a run of bad segments) does not pin the process to WAV.
+    """
+
+    def __init__(self, preferred: str, max_rejections: int, retry_seconds: float):
+        self.preferred = preferred if preferred in TRANSPORT_CODECS else "wav"
+        self.max_rejections = max_rejections
+        self.retry_seconds = retry_seconds
+        self.rejections = 0
+        self.downgraded_at = None
+
+    @property
+    def current(self) -> str:
+        if self.downgraded_at is not None and time.monotonic() - self.downgraded_at >= self.retry_seconds:
+            print(f"Retrying {self.preferred} transport with the STT backend")
+            self.downgraded_at = None
+            self.rejections = 0
+        return "wav" if self.downgraded_at is not None else self.preferred
+
+    def accepted(self, fmt: str):
+        if fmt != "wav":
+            self.rejections = 0
+
+    def rejected(self, fmt: str):
+        self.rejections += 1
+        if self.rejections >= self.max_rejections and self.downgraded_at is None:
+            print(f"STT backend rejected {fmt} {self.rejections} times in a row, sending WAV for {self.retry_seconds:g}s")
+            self.downgraded_at = time.monotonic()
+
+transport = TransportNegotiator(STT_TRANSPORT_FORMAT, STT_FORMAT_MAX_REJECTIONS, STT_FORMAT_RETRY_SECONDS)
+
+transcript_cache = DiskCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_BYTES) if TRANSCRIPT_CACHE_ENABLED else None
+
+def wav_header(data_size: int) -> bytes:
+    """Canonical 44-byte header for 16kHz mono PCM16 WAV."""
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16, 1, 1,
+        SAMPLE_RATE, PCM_BYTES_PER_SECOND, 2, 16, b'data', data_size
+    )
+
+class ConvertedAudio:
+    """16kHz mono PCM16 WAV produced by process_audio, spooled in memory or on disk."""
 
-def process_audio(input_bytes: bytes) -> bytes:
+    def __init__(self, wav_file, pcm_bytes: int, silences: list, sha256: str,
+                 source: dict = None, source_bytes: bytes = None):
+        self.wav_file = wav_file
+        self.pcm_bytes = pcm_bytes
+        self.silences = silences
+        self.sha256 = sha256
+        # Input stream as ffmpeg reported it ({codec, sample_rate, channels}) and, for
+        # small uploads, the original bytes for pass-through
+        self.source = source or {}
+        self.source_bytes = source_bytes
+
+    @property
+    def duration(self) -> float:
+        return self.pcm_bytes / PCM_BYTES_PER_SECOND
+
+    def close(self):
+        self.wav_file.close()
+
+async def process_audio(upload: UploadFile) -> ConvertedAudio:
     """
-    Uses the system FFmpeg (via subprocess) to convert input audio bytes 
-    to 16kHz, mono, wav format (PCM 16-bit).
+    Streams the upload through the system FFmpeg into 16kHz, mono, PCM 16-bit WAV.
+
+    The upload is fed to ffmpeg's stdin in chunks while stdout is drained
+    concurrently into a spooled temp file, so neither the raw media nor the WAV
+    is ever held in memory as a whole and the event loop stays free.
+    The PCM is hashed on the way through to key the transcript cache.
     """
     command = [
         'ffmpeg',
         '-i', 'pipe:0',             # Read from stdin
-        '-f', 'wav',                # Output format wav
+        '-af', f'silencedetect=noise={SILENCE_NOISE_DB}dB:d={SILENCE_MIN_SECONDS}',  # Logs silences to stderr
+        '-f', 's16le',              # Raw PCM; the WAV header is written once the size is known
         '-acodec', 'pcm_s16le',     # Audio codec
         '-ac', '1',                 # Mono (1 channel)
-        '-ar', '16000',             # Sample rate 16kHz
+        '-ar', str(SAMPLE_RATE),    # Sample rate 16kHz
         'pipe:1'                    # Write to stdout
     ]
 
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    wav_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    wav_file.write(b'\0' * WAV_HEADER_SIZE)
+    pcm_hash = hashlib.sha256()
+    source_chunks, source_size = [], 0
+
+    async def feed_stdin():
+        nonlocal source_size
+        try:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                UPLOAD_BYTES.inc(len(chunk))
+                source_size += len(chunk)
+                if source_size <= PASSTHROUGH_MAX_BYTES:
+                    source_chunks.append(chunk)
+                else:
+                    source_chunks.clear()
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg gave up on the input; its exit code and stderr say why
+            pass
+        finally:
+            process.stdin.close()
+
+    async def drain_stdout():
+        while True:
+            chunk = await process.stdout.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            pcm_hash.update(chunk)
+            wav_file.write(chunk)
+
     try:
-        # We call the ffmpeg command directly
-        process = subprocess.Popen(
-            command,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+        # stderr is read concurrently too, otherwise a chatty ffmpeg fills the pipe and stalls
+        _, _, err = await asyncio.gather(feed_stdin(), drain_stdout(), process.stderr.read())
+        await process.wait()
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        wav_file.close()
+        raise
+
+    if process.returncode != 0:
+        wav_file.close()
+        error_msg = err.decode(errors="replace")[-2000:] if err else "Unknown FFmpeg error"
+        print(f"FFmpeg Error: {error_msg}")
+        raise HTTPException(status_code=400, detail=f"FFmpeg conversion failed: {error_msg}")
+
+    pcm_bytes = wav_file.tell() - WAV_HEADER_SIZE
+    wav_file.seek(0)
+    wav_file.write(wav_header(pcm_bytes))
+    wav_file.seek(0)
+    log = err.decode(errors="replace")
+    silences = parse_silences(log, pcm_bytes / PCM_BYTES_PER_SECOND)
+    source_bytes = b"".join(source_chunks) if source_size <= PASSTHROUGH_MAX_BYTES else None
+    return ConvertedAudio(wav_file, pcm_bytes, silences, pcm_hash.hexdigest(), parse_source_stream(log), source_bytes)
+
+def parse_source_stream(ffmpeg_log: str) -> dict:
+    """Codec, sample rate and channel layout of the input's first audio stream."""
+    match = re.search(r'Stream #0:\d+.*?: Audio: (\w+)[^,\n]*, (\d+) Hz, ([\w.()]+)', ffmpeg_log.split("Output #0")[0])
+    if not match:
+        return {}
+    return {"codec": match.group(1), "sample_rate": int(match.group(2)), "channels": match.group(3)}
+
+def parse_silences(ffmpeg_log: str, duration: float) -> list:
+    """[(start, end)] seconds from silencedetect's 'silence_start: X' / 'silence_end: Y' lines."""
+    silences, start = [], None
+    for kind, value in re.findall(r'silence_(start|end): (-?[\d.]+)', ffmpeg_log):
+        if kind == "start":
+            start = max(0.0, float(value))
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    if start is not None:
+        # Audio ended while still silent
+        silences.append((start, duration))
+    return silences
+
+def plan_segments(duration: float, silences: list, seg_start: float = 0.0) -> list:
+    """
+    Splits [seg_start, duration] into (start, end) segments no longer than SEGMENT_MAX_SECONDS,
+    cutting in the middle of the latest silence that leaves at least
+    SEGMENT_MIN_SECONDS in the segment, or hard-cutting when there is none.
+    """
+    cut_points = [(start + end) / 2 for start, end in silences]
+    segments = []
+    while duration - seg_start > SEGMENT_MAX_SECONDS:
+        limit = seg_start + SEGMENT_MAX_SECONDS
+        candidates = [t for t in cut_points if seg_start + SEGMENT_MIN_SECONDS <= t <= limit]
+        cut = candidates[-1] if candidates else limit
+        segments.append((seg_start, cut))
+        seg_start = cut
+    if duration > seg_start:
+        segments.append((seg_start, duration))
+    return segments
+
+def speech_regions(duration: float, silences: list) -> list:
+    """Complement of the long silences, padded by VAD_PAD_SECONDS, in original media time."""
+    regions, cursor = [], 0.0
+    for start, end in silences:
+        if end - start < VAD_MIN_SILENCE_SECONDS:
+            continue
+        if start > 0:
+            regions.append((cursor, min(start + VAD_PAD_SECONDS, end)))
+        # Trailing silence has no speech after it to pad
+        cursor = end if end >= duration else max(start, end - VAD_PAD_SECONDS)
+    if cursor < duration:
+        regions.append((cursor, duration))
+    return [(start, end) for start, end in regions if end > start]
+
+def plan_speech_segments(duration: float, silences: list) -> list:
+    """
+    Like plan_segments, but over speech only: each segment is a list of
+    (start, end) spans in original media time, packed up to SEGMENT_MAX_SECONDS
+    of speech. The spans are the timestamp map from trimmed audio back to the media.
+    """
+    segments, current, current_length = [], [], 0.0
+    for region_start, region_end in speech_regions(duration, silences):
+        inner = [s for s in silences if region_start <= s[0] and s[1] <= region_end]
+        for start, end in plan_segments(region_end, inner, seg_start=region_start):
+            if current and current_length + (end - start) > SEGMENT_MAX_SECONDS:
+                segments.append(current)
+                current, current_length = [], 0.0
+            current.append((start, end))
+            current_length += end - start
+    if current:
+        segments.append(current)
+    return segments
+
+def read_segment(wav_file, lock: threading.Lock, spans: list) -> bytes:
+    """Copies the (start, end) spans of PCM out of the shared WAV file as one standalone WAV."""
+    pcm = bytearray()
+    with lock:
+        for start, end in spans:
+            # Byte offsets stay on 16-bit sample boundaries
+            first = WAV_HEADER_SIZE + int(start * SAMPLE_RATE) * 2
+            last = WAV_HEADER_SIZE + int(end * SAMPLE_RATE) * 2
+            wav_file.seek(first)
+            pcm += wav_file.read(last - first)
+    return wav_header(len(pcm)) + bytes(pcm)
+
+class MultipartBody:
+    """
+    Multipart/form-data body with a known length. httpx streams it block by
+    block with a Content-Length header, instead of building the whole encoded
+    body in memory first.
+    """
+
+    def __init__(self, fileobj, size: int, filename: str, content_type: str, fields: dict = None):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        head = "".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in (fields or {}).items()
+        )
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
         )
-        
-        # Feed the raw bytes and get the converted output
-        out, err = process.communicate(input=input_bytes)
-        
-        if process.returncode != 0:
-            error_msg = err.decode() if err else "Unknown FFmpeg error"
-            print(f"FFmpeg Error: {error_msg}")
-            raise Exception(error_msg)
-            
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        self._parts = [io.BytesIO(head.encode()), fileobj, io.BytesIO(tail)]
+        self._length = len(head.encode()) + size + len(tail)
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        out = b""
+        while self._parts and (size < 0 or len(out) < size):
+            chunk = self._parts[0].read(-1 if size < 0 else size - len(out))
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            out += chunk
         return out
 
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"FFmpeg conversion failed: {str(e)}")
+    async def __aiter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+async def post_to_backend(payload: bytes, filename: str, content_type: str = 'audio/wav') -> dict:
+    body = MultipartBody(
+        io.BytesIO(payload), len(payload), filename, content_type, fields={"response_format": "json"}
+    )
+    response = await backend_client.post(
+        STT_BACKEND_URL, content=body,
+        headers={"Content-Type": body.content_type, "Content-Length": str(len(body))}
+    )
+    response.raise_for_status()
+    return response.json()
+
+async def encode_audio(wav_bytes: bytes, fmt: str) -> bytes:
+    """
+    Re-encodes one (bounded-size) WAV segment into the transport format. Encoders
+    share ffmpeg_gate with conversions; when it is full, AdmissionRejected tells
+    the caller to send WAV instead.
+    """
+    command = ['ffmpeg', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0', *TRANSPORT_CODECS[fmt][3], 'pipe:1']
+    async with ffmpeg_gate.slot() as queue_seconds:
+        FFMPEG_QUEUE_SECONDS.observe(queue_seconds)
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            out, err = await process.communicate(wav_bytes)
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+    if process.returncode != 0:
+        raise RuntimeError(err.decode(errors="replace")[-500:] or f"ffmpeg exited with {process.returncode}")
+    return out
+
+def passthrough_payload(audio: ConvertedAudio):
+    """The original upload, when it is already what the backend would receive."""
+    source = audio.source
+    codec = TRANSPORT_CODECS[transport.current][0]
+    if audio.source_bytes is None or source.get("codec") != codec or source.get("channels") != "mono":
+        return None
+    # Opus always reports 48kHz; any other codec has to be 16kHz already
+    if codec != "opus" and source.get("sample_rate") != SAMPLE_RATE:
+        return None
+    return audio.source_bytes
+
+async def send_segment(wav_bytes: bytes, name: str, payload: bytes = None) -> dict:
+    """Posts one segment in the negotiated transport format, falling back to WAV."""
+    fmt = transport.current
+    if payload is None and fmt != "wav":
+        try:
+            payload = await encode_audio(wav_bytes, fmt)
+        except Exception as e:
+            print(f"{fmt} encoding failed ({e}), sending WAV")
+            fmt = "wav"
+    if fmt == "wav" or payload is None:
+        fmt, payload = "wav", wav_bytes
+    _, content_type, ext, _ = TRANSPORT_CODECS[fmt]
+    try:
+        result = await post_to_backend(payload, f"{name}.{ext}", content_type)
+    except httpx.HTTPStatusError as e:
+        status_code = e.response.status_code
+        if fmt == "wav" or status_code not in (400, 415):
+            raise
+        print(f"STT backend rejected {fmt} audio for {name} ({status_code}), resending as WAV")
+        transport.rejected(fmt)
+        fmt, payload = "wav", wav_bytes
+        result = await post_to_backend(payload, f"{name}.wav", 'audio/wav')
+    else:
+        transport.accepted(fmt)
+    TRANSPORT_BYTES.inc(len(payload), format=fmt)
+    return result
+
+def plan_transcription(audio: ConvertedAudio) -> list:
+    """Segments to send to the backend, each a list of (start, end) spans in media time."""
+    if not VAD_TRIM:
+        return [[span] for span in plan_segments(audio.duration, audio.silences)]
+    segments = plan_speech_segments(audio.duration, audio.silences)
+    speech = sum(end - start for spans in segments for start, end in spans)
+    VAD_TRIMMED_SECONDS.inc(audio.duration - speech)
+    return segments
+
+async def iter_segments(audio: ConvertedAudio, filename: str, plan: list):
+    """
+    Transcribes the planned segments concurrently (SEGMENT_FANOUT at a time) and
+    yields each result as soon as it is ready, in completion order.
+    A failed segment is retried on its own; the others are not resent.
+    Raises asyncio.TimeoutError once STT_DEADLINE_SECONDS have passed.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + STT_DEADLINE_SECONDS
+    slots = asyncio.Semaphore(SEGMENT_FANOUT)
+    file_lock = threading.Lock()
+    stem = os.path.splitext(filename or "audio")[0]
+    # A single segment covering the whole upload can skip decoding and re-encoding
+    passthrough = None
+    if len(plan) == 1 and not VAD_TRIM:
+        passthrough = passthrough_payload(audio)
+        if passthrough is not None:
+            PASSTHROUGH_TOTAL.inc()
+
+    async def transcribe_one(index, spans):
+        start, end = spans[0][0], spans[-1][1]
+        async with slots:
+            wav_bytes = await loop.run_in_executor(None, read_segment, audio.wav_file, file_lock, spans)
+            for attempt in range(SEGMENT_RETRIES + 1):
+                try:
+                    result = await send_segment(wav_bytes, f"{index:04d}_{stem}", passthrough)
+                    break
+                except httpx.HTTPError as e:
+                    if attempt >= SEGMENT_RETRIES:
+                        raise
+                    SEGMENT_RETRIES_TOTAL.inc()
+                    print(f"Segment {index} ({start:.1f}s-{end:.1f}s) failed: {e}, retrying...")
+                    await asyncio.sleep(2 ** attempt)
+        SEGMENTS_TOTAL.inc()
+        AUDIO_SECONDS.inc(sum(e - s for s, e in spans))
+        segment = {"index": index, "start": round(start, 3), "end": round(end, 3), "text": result.get("text", "").strip()}
+        if VAD_TRIM:
+            segment["spans"] = [[round(s, 3), round(e, 3)] for s, e in spans]
+        return segment
+
+    tasks = [asyncio.ensure_future(transcribe_one(i, spans)) for i, spans in enumerate(plan)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await asyncio.wait_for(next_done, max(0.0, deadline - loop.time()))
+    finally:
+        # Also runs when a client disconnects; cancelling a task aborts its backend request
+        for task in tasks:
+            task.cancel()
+
+async def transcribe_segments(audio: ConvertedAudio, filename: str) -> list:
+    segments = [segment async for segment in iter_segments(audio, filename, plan_transcription(audio))]
+    return sorted(segments, key=lambda segment: segment["index"])
+
+async def convert_upload(file: UploadFile) -> ConvertedAudio:
+    """Stream the upload through FFmpeg into 16kHz Mono PCM, once a slot is free."""
+    try:
+        async with ffmpeg_gate.slot() as queue_seconds:
+            FFMPEG_QUEUE_SECONDS.observe(queue_seconds)
+            with FFMPEG_SECONDS.time():
+                return await process_audio(file)
+    except AdmissionRejected as e:
+        FFMPEG_REJECTED.inc()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def cache_key_for(audio: ConvertedAudio) -> str:
+    return hashlib.sha256(f"{TRANSCRIPT_CACHE_VERSION}:{VAD_TRIM}:{STT_TRANSPORT_FORMAT}:{audio.sha256}".encode()).hexdigest()
+
+async def cached_segments(audio: ConvertedAudio):
+    """Identical audio (reposts, pipeline retries) is answered from the cache."""
+    if transcript_cache is None:
+        return None
+    cached = await asyncio.get_event_loop().run_in_executor(None, transcript_cache.get, cache_key_for(audio))
+    CACHE_LOOKUPS.inc(result="hit" if cached else "miss")
+    return cached["segments"] if cached else None
+
+async def store_segments(audio: ConvertedAudio, segments: list):
+    if transcript_cache is not None:
+        await asyncio.get_event_loop().run_in_executor(
+            None, transcript_cache.set, cache_key_for(audio), {"segments": segments}
+        )
+
+def observe_backend(audio: ConvertedAudio, backend_started: float):
+    backend_seconds = time.perf_counter() - backend_started
+    BACKEND_SECONDS.observe(backend_seconds)
+    if audio.duration > 0:
+        SECONDS_PER_AUDIO_MINUTE.observe(backend_seconds / (audio.duration / 60))
+
+class ClientDisconnected(Exception):
+    pass
+
+async def until_disconnected(request: Request, coro):
+    """Awaits `coro`, cancelling it (and the backend calls it made) if the caller goes away."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+def transcription_response(filename: str, audio: ConvertedAudio, segments: list, cached: bool) -> dict:
+    return {
+        "filename": filename,
+        "transcription": " ".join(segment["text"] for segment in segments if segment["text"]),
+        "segments": segments,
+        "duration": round(audio.duration, 3),
+        "parameters": "16kHz, Mono, PCM16",
+        "cached": cached,
+        "status": "success"
+    }
 
 @app.post("/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
+async def transcribe_audio(request: Request, file: UploadFile = File(...)):
     if not file:
         raise HTTPException(status_code=400, detail="No file uploaded")
 
+    started = time.perf_counter()
+    status = "error"
+    audio = None
+    INFLIGHT.inc()
+
+    async def transcribe():
+        nonlocal audio
+        # 1. Convert to 16kHz Mono via FFmpeg
+        audio = await convert_upload(file)
+
+        # 2. Serve repeats from the cache
+        segments = await cached_segments(audio)
+        cached = segments is not None
+        if not cached:
+            # 3. Forward silence-aligned segments to your transcription backend in parallel
+            backend_started = time.perf_counter()
+            segments = await transcribe_segments(audio, file.filename)
+            observe_backend(audio, backend_started)
+            await store_segments(audio, segments)
+        return segments, cached
+
     try:
-        # 1. Read raw uploaded file bytes
-        raw_content = await file.read()
-        
-        # 2. Convert to 16kHz Mono via system FFmpeg
-        processed_content = process_audio(raw_content)
-        
-        # 3. Prepare the converted audio for the STT backend
-        files = {
-            'file': (file.filename, io.BytesIO(processed_content), 'audio/wav')
-        }
-        data = {"response_format": "json"}
-
-        # 4. Forward to your transcription backend
-        response = requests.post(STT_BACKEND_URL, files=files, data=data, timeout=1200)
-        response.raise_for_status()
-        print(response.json().get("text"))
-        return {
-            "filename": file.filename,
-            "transcription": response.json().get("text", ""),
-            "parameters": "16kHz, Mono, PCM16",
-            "status": "success"
-        }
-        
-
-    except requests.exceptions.RequestException as e:
+        segments, cached = await until_disconnected(request, transcribe())
+        status = "cached" if cached else "success"
+        response = transcription_response(file.filename, audio, segments, cached)
+        print(response["transcription"])
+        return response
+
+    except HTTPException as e:
+        if e.status_code == 429:
+            status = "rejected"
+        raise
+    except ClientDisconnected:
+        status = "disconnected"
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"STT backend did not finish within {STT_DEADLINE_SECONDS:g}s")
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=502, detail=f"STT Backend Error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    finally:
+        if audio is not None:
+            audio.close()
+        INFLIGHT.dec()
+        REQUEST_SECONDS.observe(time.perf_counter() - started)
+        REQUESTS_TOTAL.inc(status=status)
+        await file.close()
+
+def sse_event(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+@app.post("/transcribe/stream")
+async def transcribe_audio_stream(file: UploadFile = File(...)):
+    """
+    Server-Sent Events variant of /transcribe: a 'meta' event once the audio is
+    converted, one 'segment' event per segment as soon as it is transcribed
+    (completion order, use 'index' to order them), then 'done' with the same
+    body /transcribe returns, or 'error'.
+    """
+    if not file:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+
+    # Conversion errors (400, 429) still come back as plain HTTP errors
+    try:
+        audio = await convert_upload(file)
+    except HTTPException as e:
+        REQUESTS_TOTAL.inc(status="rejected" if e.status_code == 429 else "error")
+        raise
     finally:
         await file.close()
+    filename = file.filename
+
+    async def events():
+        started = time.perf_counter()
+        status = "error"
+        INFLIGHT.inc()
+        try:
+            segments = await cached_segments(audio)
+            cached = segments is not None
+            if cached:
+                yield sse_event("meta", {"filename": filename, "duration": round(audio.duration, 3), "segments": len(segments), "cached": True})
+                for segment in segments:
+                    yield sse_event("segment", segment)
+            else:
+                plan = plan_transcription(audio)
+                yield sse_event("meta", {"filename": filename, "duration": round(audio.duration, 3), "segments": len(plan), "cached": False})
+                backend_started = time.perf_counter()
+                segments = []
+                async for segment in iter_segments(audio, filename, plan):
+                    if not segments:
+                        FIRST_SEGMENT_SECONDS.observe(time.perf_counter() - started)
+                    segments.append(segment)
+                    yield sse_event("segment", segment)
+                observe_backend(audio, backend_started)
+                segments.sort(key=lambda segment: segment["index"])
+                await store_segments(audio, segments)
+            status = "cached" if cached else "success"
+            yield sse_event("done", transcription_response(filename, audio, segments, cached))
+        except asyncio.TimeoutError:
+            yield sse_event("error", {"status": 504, "detail": f"STT backend did not finish within {STT_DEADLINE_SECONDS:g}s"})
+        except httpx.HTTPError as e:
+            yield sse_event("error", {"status": 502, "detail": f"STT Backend Error: {str(e)}"})
+        except Exception as e:
+            yield sse_event("error", {"status": 500, "detail": f"Internal Server Error: {str(e)}"})
+        finally:
+            audio.close()
+            INFLIGHT.dec()
+            REQUEST_SECONDS.observe(time.perf_counter() - started)
+            REQUESTS_TOTAL.inc(status=status)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/cache/stats")
+async def cache_stats():
+    if transcript_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **transcript_cache.stats()}
+
+@app.get("/metrics")
+async def get_metrics():
+    FFMPEG_ACTIVE.set(ffmpeg_gate.active)
+    FFMPEG_WAITING.set(ffmpeg_gate.waiting)
+    TRANSPORT_DOWNGRADED.set(1 if transport.downgraded_at is not None else 0)
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
     # This allows you to run the file directly with 'python whisper_services.py'
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)